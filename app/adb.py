@@ -1,38 +1,543 @@
+import asyncio
+import atexit
 import logging
+import os
+import re
+import secrets
+import signal
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
-from flask import flash
-
-from validation import is_valid_ip
+from adb_proto import AdbProtocolError, adb_shell
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
 
+SHELL_SEPARATOR = '__SEP__'  # Parancsok kimenetét elválasztó jelölő (egyszeri 'adb shell' futtatásnál)
+
+# Eszközönként egy folyamatosan futó 'adb shell' munkamenet, hogy ne kelljen minden parancshoz új folyamatot indítani
+shell_sessions: dict[str, 'AdbShellSession'] = {}
+shell_sessions_lock = threading.Lock()
+
+# Közös szálkészlet a több eszközön párhuzamosan futó ADB parancsokhoz, hogy ne kelljen hívásonként létrehozni
+ADB_EXECUTOR_MAX_WORKERS = 16
+adb_executor = ThreadPoolExecutor(max_workers=ADB_EXECUTOR_MAX_WORKERS, thread_name_prefix='adb')
+atexit.register(adb_executor.shutdown, wait=False)
+
+# Azok az eszközök, amelyekhez már sikeresen csatlakoztunk
+connected_ips: set[str] = set()
+# Csatlakoztatott eszközönként előre összeállított 'adb -s <ip>' parancs eleje
+adb_command_prefixes: dict[str, tuple[str, str, str]] = {}
+
+# A Python által nyitott fájlleírók alapból nem öröklődnek (PEP 446), így folyamatindításkor felesleges
+# az összes leírót végigjárni és bezárni
+SPAWN_CLOSE_FDS = False
+
+DEVICE_LOST_ERRORS = ('device offline', 'not found')  # Ilyen hibánál újra kell csatlakozni az eszközhöz
+
+# Egy ADB parancs legfeljebb ennyi ideig futhat, így egy nem válaszoló eszköz nem akasztja meg az adatgyűjtést
+ADB_COMMAND_TIMEOUT_SECONDS = 30
+ADB_TIMEOUT_RETURNCODE = 124  # Időtúllépéskor visszaadott kilépési kód (mint a timeout parancsé)
+ADB_SERVER_START_TIMEOUT_SECONDS = 5
+
+# Az eszköz tulajdonságai (név, Android verzió stb.) munkamenet közben nem változnak, ezért gyorsítótárazzuk.
+# Újracsatlakozáskor, lecsatlakozáskor és a CPU gyűjtés leállításakor a gyorsítótár törlődik (invalidate_device_info)
+DEVICE_INFO_TTL_SECONDS = 3600
+device_info_cache: dict[str, tuple[float, dict[str, str]]] = {}
+device_info_lock = threading.Lock()  # Csak a gyorsítótárat védi, ADB hívás alatt nincs fogva
+device_fetch_locks: dict[str, threading.Lock] = {}  # Eszközönként egy lekérés fut egyszerre
+UNKNOWN_DEVICE_PROPERTY = 'Unknown'  # Hiányzó vagy üres tulajdonság helyett mentett érték
+GETPROP_PATTERN = re.compile(rb'^\[([^\]]+)\]: \[(.*)\]\r?$', re.MULTILINE)  # '[név]: [érték]' sorok
+
 
 # ADB parancsokat kezelő függvények
+def start_adb_server() -> bool:
+    """
+    Elindítja az ADB szervert, ha még nem fut, így az első parancsnak nem kell megvárnia az indulását.
+
+    Hiba esetén csak naplóz, az adb kliens az első parancsnál úgyis megpróbálja elindítani a szervert.
+
+    Returns:
+        bool: True, ha az ADB szerver fut.
+    """
+    try:
+        result = subprocess.run(('adb', 'start-server'), capture_output=True, text=True, close_fds=SPAWN_CLOSE_FDS,
+                                timeout=ADB_SERVER_START_TIMEOUT_SECONDS)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f'Nem sikerült elindítani az ADB szervert: {e}')
+        return False
+
+    if result.returncode != 0:
+        logger.error(f'Nem sikerült elindítani az ADB szervert: {result.stderr}')
+        return False
+    logger.info('ADB szerver elindítva.')
+    return True
+
+
+def get_adb_command_prefix(ip_address: str) -> tuple[str, str, str]:
+    """
+    Visszaadja az eszközhöz tartozó 'adb -s <ip>' parancs elejét, csatlakoztatott eszköznél a tároltat.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+
+    Returns:
+        tuple[str, str, str]: Az ADB parancs eleje.
+    """
+    return adb_command_prefixes.get(ip_address) or ('adb', '-s', ip_address)
+
+
+def timeout_result(args: tuple[str, ...]) -> subprocess.CompletedProcess:
+    """
+    Az időtúllépés miatt megszakított ADB parancs eredménye.
+
+    Args:
+        args (tuple[str, ...]): Az ADB parancs és argumentumai.
+
+    Returns:
+        subprocess.CompletedProcess: ADB_TIMEOUT_RETURNCODE kilépési kódú eredmény.
+    """
+    logger.warning(f'Az ADB parancs túllépte az időkorlátot ({ADB_COMMAND_TIMEOUT_SECONDS} s): {args}')
+    return subprocess.CompletedProcess(args=args, returncode=ADB_TIMEOUT_RETURNCODE, stdout='', stderr='timeout')
+
+
+def execute_adb_command(ip_address: str, command: list[str]) -> subprocess.CompletedProcess:
+    """
+    Végrehajt egy ADB parancsot, lehetőleg új adb folyamat indítása nélkül.
+
+    A shell parancsokat az eszköz folyamatosan futó shell munkamenetében futtatja, ha ez nem elérhető,
+    közvetlenül az ADB szervernek küldi (adb_proto). Minden más esetben az adb klienst használja.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+        command (list[str]): Egy lista, amely tartalmazza az ADB parancsot és annak argumentumait.
+
+    Returns:
+        subprocess.CompletedProcess: Az ADB parancs végrehajtásának eredménye.
+    """
+    args = get_adb_command_prefix(ip_address) + tuple(command)
+
+    if command[0] == 'shell' and len(command) > 1:
+        shell_command = ' '.join(command[1:])
+        try:
+            returncode, output = run_shell_session_commands(ip_address, [shell_command])[0]
+            # A munkamenet a hibakimenetet nem adja vissza
+            return subprocess.CompletedProcess(args=args, returncode=returncode, stdout=output, stderr='')
+        except subprocess.TimeoutExpired:
+            return timeout_result(args)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f'ADB shell munkamenet nem elérhető ({ip_address}): {e}')
+
+        try:
+            return adb_shell(ip_address, shell_command)
+        except AdbProtocolError as e:  # Pl. nem található vagy offline eszköz
+            return subprocess.CompletedProcess(args=args, returncode=1, stdout='', stderr=f'error: {e}')
+        except TimeoutError:
+            return timeout_result(args)
+        except OSError as e:
+            logger.warning(f'Az ADB szerver közvetlenül nem érhető el, adb kliens használata: {e}')
+
+    # Az adb kliens szükség esetén el is indítja az ADB szervert
+    try:
+        return subprocess.run(args, capture_output=True, text=True, close_fds=SPAWN_CLOSE_FDS,
+                              timeout=ADB_COMMAND_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:  # A subprocess.run ilyenkor már leállította az adb folyamatot
+        return timeout_result(args)
+
+
 def run_adb_command(ip_address: str, command: list[str]) -> subprocess.CompletedProcess:
     """
     Végrehajt egy ADB parancsot a megadott IP-címmel rendelkező eszközön.
 
+    Az IP címet a kérés határán (IpForm, home nézet) ellenőrizzük és normalizáljuk, itt már nem.
+
     Args:
-        ip_address (str): Az eszköz IP-címe.
+        ip_address (str): Az eszköz ellenőrzött IP-címe.
         command (list[str]): Egy lista, amely tartalmazza az ADB parancsot és annak argumentumait.
 
     Returns:
         subprocess.CompletedProcess: Az ADB parancs végrehajtásának eredménye,
         amely tartalmazza a standard kimenetet (stdout) és a hibakimenetet (stderr).
-        None: Ha az IP-cím érvénytelen.
+    """
+    logger.info(f'ADB parancs futtatása: {command} az eszközön {ip_address}')
+    result = execute_adb_command(ip_address, command)
 
-    Errors:
-        - Ha az IP-cím érvénytelen, egy hibaüzenet jelenik meg a felhasználói felületen (flash üzenet).
+    # Ha a csatlakoztatott eszköz elérhetetlen, egyszer megpróbálunk újracsatlakozni, majd megismételjük a parancsot.
+    # A lecsatlakoztatott eszközhöz nem csatlakozunk újra.
+    if (result.returncode != 0 and ip_address in connected_ips and command[0] not in ('connect', 'disconnect')
+            and any(error in result.stderr for error in DEVICE_LOST_ERRORS)):
+        # Sikertelen újracsatlakozás után is a csatlakoztatottak között marad, a következő parancs újra próbálkozik
+        logger.warning(f'Az eszköz nem elérhető ({ip_address}), újracsatlakozás: {result.stderr.strip()}')
+        try:
+            reconnect = subprocess.run(('adb', 'connect', ip_address), capture_output=True, text=True,
+                                       close_fds=SPAWN_CLOSE_FDS, timeout=ADB_COMMAND_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            return timeout_result(('adb', 'connect', ip_address))
+        if 'connected' in reconnect.stdout.lower():
+            logger.info(f'Sikeres újracsatlakozás, parancs ismétlése: {command} az eszközön {ip_address}')
+            result = execute_adb_command(ip_address, command)
+
+    return result
+
+
+async def run_adb_command_async(ip_address: str,
+                                command: list[str] | tuple[str, ...]) -> subprocess.CompletedProcess:
     """
-    if not is_valid_ip(ip_address):
-        flash('Érvénytelen IP cím.', 'Hiba')
-        logger.error(f'Érvénytelen IP cím: {ip_address}, ADB parancs futtatása sikertelen')
-        return subprocess.CompletedProcess(args=['adb'], returncode=1)  # Dummy return, hogy a type egyforma maradjon
+    Végrehajt egy ADB parancsot aszinkron módon, így több parancs futhat egyszerre.
 
-    logger.info(f'ADB parancs futtatása: {command} az eszközön {ip_address}')
-    return subprocess.run(['adb', '-s', ip_address] + command, capture_output=True, text=True)
+    A shell parancsok az eszköz folyamatosan futó 'adb shell' munkamenetében futnak (lásd run_adb_command).
+
+    Args:
+        ip_address (str): Az eszköz ellenőrzött IP-címe.
+        command (list[str] | tuple[str, ...]): Az ADB parancs és argumentumai. Az ismétlődő parancsokat
+            érdemes előre összeállított tuple-ként átadni, ezt a tuple() nem másolja le.
+
+    Returns:
+        subprocess.CompletedProcess: Az ADB parancs végrehajtásának eredménye.
+    """
+    if command[0] == 'shell':
+        # A shell parancsok az eszköz munkamenetében futnak (új adb folyamat nélkül), a blokkoló olvasás
+        # a közös szálkészletben, így nem tartja fel az eseményhurkot
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(adb_executor, run_adb_command, ip_address, list(command))
+
+    args = get_adb_command_prefix(ip_address) + tuple(command)
+    logger.info(f'ADB parancs futtatása (aszinkron): {command} az eszközön {ip_address}')
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE, close_fds=SPAWN_CLOSE_FDS)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), ADB_COMMAND_TIMEOUT_SECONDS)
+    except TimeoutError:
+        process.kill()
+        await process.wait()
+        return timeout_result(args)
+    return subprocess.CompletedProcess(args=args, returncode=process.returncode,
+                                       stdout=stdout.decode(errors='replace'), stderr=stderr.decode(errors='replace'))
+
+
+def run_adb_commands_concurrently(commands: list[tuple[str, list[str]]]) -> list[subprocess.CompletedProcess]:
+    """
+    Több ADB parancs párhuzamos végrehajtása, akár különböző eszközökön.
+
+    Szinkron hívóknak szól, a teljes futási idő a leglassabb parancs ideje lesz az összeg helyett.
+
+    Args:
+        commands (list[tuple[str, list[str]]]): (IP-cím, ADB parancs) párok listája.
+
+    Returns:
+        list[subprocess.CompletedProcess]: A parancsok eredményei, a bemenet sorrendjében.
+    """
+    async def run_all() -> list[subprocess.CompletedProcess]:
+        return await asyncio.gather(*(run_adb_command_async(ip_address, command) for ip_address, command in commands))
+
+    return asyncio.run(run_all())
+
+
+def map_adb_command(ip_addresses: list[str],
+                    command_builder: Callable[[str], list[str]]) -> list[subprocess.CompletedProcess]:
+    """
+    ADB parancs párhuzamos futtatása több eszközön a közös szálkészlet segítségével.
+
+    Args:
+        ip_addresses (list[str]): Az eszközök IP-címei.
+        command_builder (Callable[[str], list[str]]): Az IP-címből az ADB parancsot előállító függvény.
+
+    Returns:
+        list[subprocess.CompletedProcess]: A parancsok eredményei, az IP-címek sorrendjében.
+    """
+    return list(adb_executor.map(lambda ip_address: run_adb_command(ip_address, command_builder(ip_address)),
+                                 ip_addresses))
+
+
+class AdbShellSession:
+    """
+    Egy eszközhöz tartozó, folyamatosan futó 'adb shell' folyamat, amelynek a bemenetére írjuk a parancsokat.
+
+    Minden parancs után egy egyedi záró jelölőt és a parancs kilépési kódját íratjuk ki, a kimenetet eddig olvassuk.
+
+    Attributes:
+        ip_address (str): Az eszköz IP-címe.
+        process (subprocess.Popen): Az 'adb shell' folyamat.
+        lock (threading.Lock): Egyszerre csak egy szál írhat a munkamenetbe és olvashat belőle.
+    """
+
+    def __init__(self, ip_address: str) -> None:
+        self.ip_address = ip_address
+        self.lock = threading.Lock()
+        # Bináris mód: a kimenetet parancsonként egyszer dekódoljuk, nem soronként
+        # Saját folyamatcsoport, így időtúllépéskor az esetleges gyermekfolyamataival együtt leállítható
+        self.process = subprocess.Popen(get_adb_command_prefix(ip_address) + ('shell',), stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True)
+        logger.info(f'ADB shell munkamenet elindítva: {ip_address}')
+
+    def is_alive(self) -> bool:
+        """
+        Returns:
+            bool: True, ha az 'adb shell' folyamat még fut.
+        """
+        return self.process.poll() is None
+
+    def run(self, commands: list[str], raw: bool = False) -> list[tuple[int, str | bytes]]:
+        """
+        Végrehajtja a parancsokat a munkamenetben.
+
+        Ha a parancsok ADB_COMMAND_TIMEOUT_SECONDS alatt nem futnak le, a munkamenetet leállítja.
+
+        Args:
+            commands (list[str]): A végrehajtandó shell parancsok.
+            raw (bool): True esetén a kimenetet dekódolás nélkül, bájtokként adja vissza.
+
+        Returns:
+            list[tuple[int, str | bytes]]: Parancsonként a kilépési kód és a kimenet, a parancsok sorrendjében.
+
+        Raises:
+            RuntimeError: Ha a munkamenet váratlanul bezárult.
+            OSError: Ha nem sikerült írni a munkamenetbe.
+            subprocess.TimeoutExpired: Ha a parancsok túllépték az időkorlátot.
+        """
+        marker = f'__END_{secrets.token_hex(8)}__'.encode()  # Egyedi jelölő, nem keverhető a parancs kimenetével
+        # A parancsok nem olvashatnak a munkamenet bemenetéről, különben elnyelnék a következő parancsokat
+        script = b''.join(f'{{ {command}\n}} </dev/null\necho "{marker.decode()}$?"\n'.encode()
+                          for command in commands)
+
+        timed_out = threading.Event()
+
+        def kill() -> None:
+            timed_out.set()
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)  # A blokkoló olvasás EOF-ot kap
+            except ProcessLookupError:  # Közben magától leállt
+                pass
+
+        with self.lock:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+
+            watchdog = threading.Timer(ADB_COMMAND_TIMEOUT_SECONDS, kill)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                return self.read_results(len(commands), marker, raw, timed_out)
+            finally:
+                watchdog.cancel()
+
+    def read_results(self, count: int, marker: bytes, raw: bool,
+                     timed_out: threading.Event) -> list[tuple[int, str | bytes]]:
+        """
+        Beolvassa a parancsok kimenetét a záró jelölőkig.
+
+        Args:
+            count (int): A parancsok száma.
+            marker (bytes): A parancsok kimenetét lezáró jelölő.
+            raw (bool): True esetén a kimenetet dekódolás nélkül, bájtokként adja vissza.
+            timed_out (threading.Event): Beállítva jelzi, hogy a munkamenetet az időkorlát miatt állítottuk le.
+
+        Returns:
+            list[tuple[int, str | bytes]]: Parancsonként a kilépési kód és a kimenet.
+
+        Raises:
+            RuntimeError: Ha a munkamenet váratlanul bezárult.
+            subprocess.TimeoutExpired: Ha a munkamenetet az időkorlát miatt állítottuk le.
+        """
+        results, lines = [], []
+        while len(results) < count:
+            line = self.process.stdout.readline()
+            if not line:  # EOF, a shell leállt
+                if timed_out.is_set():
+                    raise subprocess.TimeoutExpired(self.process.args, ADB_COMMAND_TIMEOUT_SECONDS)
+                raise RuntimeError(f'Az ADB shell munkamenet bezárult: {self.ip_address}')
+            line = line.rstrip(b'\r\n')
+            output, found, returncode = line.partition(marker)
+            if not found:
+                lines.append(line)
+                continue
+            if output:  # A kimenet nem sortöréssel végződött
+                lines.append(output)
+            output = b'\n'.join(lines)
+            results.append((int(returncode or 0), output if raw else output.decode(errors='replace')))
+            lines = []
+        return results
+
+    def close(self) -> None:
+        """
+        Leállítja a munkamenetet.
+        """
+        try:
+            self.process.stdin.write(b'exit\n')
+            self.process.stdin.flush()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        logger.info(f'ADB shell munkamenet leállítva: {self.ip_address}')
+
+
+def get_shell_session(ip_address: str) -> AdbShellSession:
+    """
+    Visszaadja az eszközhöz tartozó 'adb shell' munkamenetet, ha nincs ilyen vagy leállt, újat indít.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+
+    Returns:
+        AdbShellSession: Az eszköz munkamenete.
+    """
+    with shell_sessions_lock:
+        session = shell_sessions.get(ip_address)
+        if session is None or not session.is_alive():
+            session = AdbShellSession(ip_address)
+            shell_sessions[ip_address] = session
+        return session
+
+
+def run_shell_session_commands(ip_address: str, commands: list[str],
+                               raw: bool = False) -> list[tuple[int, str | bytes]]:
+    """
+    Végrehajtja a parancsokat az eszköz folyamatosan futó 'adb shell' munkamenetében.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+        commands (list[str]): A végrehajtandó shell parancsok.
+        raw (bool): True esetén a kimenetet dekódolás nélkül, bájtokként adja vissza.
+
+    Returns:
+        list[tuple[int, str | bytes]]: Parancsonként a kilépési kód és a kimenet, a parancsok sorrendjében.
+
+    Raises:
+        RuntimeError: Ha a munkamenet váratlanul bezárult.
+        OSError: Ha nem sikerült elindítani a munkamenetet vagy írni bele.
+        subprocess.TimeoutExpired: Ha a parancsok túllépték az időkorlátot.
+    """
+    session = get_shell_session(ip_address)
+    try:
+        return session.run(commands, raw=raw)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired):
+        with shell_sessions_lock:
+            if shell_sessions.get(ip_address) is session:
+                shell_sessions.pop(ip_address)
+        session.process.kill()
+        raise
+
+
+def close_shell_session(ip_address: str) -> None:
+    """
+    Leállítja az eszköz 'adb shell' munkamenetét, ha fut.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+    """
+    with shell_sessions_lock:
+        session = shell_sessions.pop(ip_address, None)
+    if session is not None:
+        session.close()
+
+
+def close_shell_sessions() -> None:
+    """
+    Leállítja az összes futó 'adb shell' munkamenetet. Kilépéskor automatikusan meghívódik.
+    """
+    with shell_sessions_lock:
+        for session in shell_sessions.values():
+            session.close()
+        shell_sessions.clear()
+
+
+atexit.register(close_shell_sessions)
+
+
+def run_adb_shell_batch(ip_address: str, commands: list[str], raw: bool = False) -> list[str] | list[bytes]:
+    """
+    Több shell parancs végrehajtása egyetlen ADB hívással.
+
+    A parancsokat az eszköz folyamatosan futó shell munkamenetében hajtja végre, ha ez nem elérhető,
+    egyetlen 'adb shell' folyamatban futtatja le őket.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+        commands (list[str]): A végrehajtandó shell parancsok.
+        raw (bool): True esetén a kimeneteket dekódolás nélkül, bájtokként adja vissza.
+
+    Returns:
+        list[str] | list[bytes]: Az egyes parancsok kimenete, a parancsok sorrendjében.
+
+    Raises:
+        RuntimeError: Ha a parancsok végrehajtása sikertelen.
+    """
+    try:
+        return [output for _, output in run_shell_session_commands(ip_address, commands, raw=raw)]
+    except subprocess.TimeoutExpired as e:  # Egyszeri futtatással sem válaszolna időben
+        raise RuntimeError(f'A kötegelt ADB parancs túllépte az időkorlátot: {e}') from e
+    except (OSError, RuntimeError) as e:
+        logger.warning(f'ADB shell munkamenet nem elérhető ({ip_address}), egyszeri futtatás következik: {e}')
+
+    result = run_adb_command(ip_address, ['shell', f' ; echo {SHELL_SEPARATOR} ; '.join(commands)])
+    if result.returncode != 0:
+        raise RuntimeError(f'Hiba a kötegelt ADB parancs futtatásakor: {result.stderr}')
+    outputs = [output.strip('\r\n') for output in result.stdout.split(SHELL_SEPARATOR)]
+    return [output.encode() for output in outputs] if raw else outputs
+
+
+def get_device_properties(ip_address: str) -> dict[str, str]:
+    """
+    Az eszköz összes rendszer tulajdonságának (getprop) lekérése egyetlen ADB hívással.
+
+    Az eredményt DEVICE_INFO_TTL_SECONDS másodpercig gyorsítótárazza, így a további tulajdonságok lekérése
+    nem igényel újabb ADB hívást.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+
+    Returns:
+        dict[str, str]: A tulajdonságok neve és értéke.
+
+    Raises:
+        RuntimeError: Ha a tulajdonságok lekérése sikertelen.
+    """
+    properties = get_cached_device_properties(ip_address)
+    if properties is not None:
+        return properties
+
+    with device_info_lock:
+        fetch_lock = device_fetch_locks.setdefault(ip_address, threading.Lock())
+
+    # Az eszköz zárja alatt történik a lekérés, így egy lassú eszköz nem tartja fel a többit
+    with fetch_lock:
+        properties = get_cached_device_properties(ip_address)  # Közben egy másik hívás lekérhette
+        if properties is not None:
+            return properties
+
+        try:
+            output = run_adb_shell_batch(ip_address, ['getprop'], raw=True)[0]
+        except (OSError, RuntimeError) as e:
+            logger.error(f'Hiba az eszköz információ lekérésekor: {e}', exc_info=True)
+            raise RuntimeError(f'Hiba: {e}')
+
+        # A bájtokon keresünk, csak a megtalált nevek és értékek kerülnek dekódolásra
+        properties = {name.decode(): value.decode(errors='replace')
+                      for name, value in GETPROP_PATTERN.findall(output)}
+        with device_info_lock:
+            device_info_cache[ip_address] = (time.monotonic(), properties)
+        logger.info(f'Eszköz tulajdonságai lekérve: {len(properties)} db, IP cím {ip_address}.')
+        return properties
+
+
+def get_cached_device_properties(ip_address: str) -> dict[str, str] | None:
+    """
+    Az eszköz gyorsítótárazott tulajdonságai, ha még nem jártak le.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+
+    Returns:
+        dict[str, str] | None: A tulajdonságok neve és értéke, vagy None, ha nincs érvényes bejegyzés.
+    """
+    with device_info_lock:
+        cached = device_info_cache.get(ip_address)
+    if cached is not None and time.monotonic() - cached[0] < DEVICE_INFO_TTL_SECONDS:
+        return cached[1]
+    return None
 
 
 def get_device_info(ip_address: str) -> tuple[str, str]:
@@ -46,28 +551,28 @@ def get_device_info(ip_address: str) -> tuple[str, str]:
         tuple: Az eszköz neve és Android verziója.
 
     Raises:
-        ValueError: Ha az IP cím érvénytelen.
+        RuntimeError: Ha a tulajdonságok lekérése sikertelen.
     """
-    if not is_valid_ip(ip_address):
-        logger.error(f'Eszköz információ lekérése sikertelen: Érvénytelen IP cím - {ip_address}')
-        raise ValueError('Érvénytelen IP cím.')
-    try:
-        device_name = subprocess.check_output(
-            ['adb', '-s', ip_address, 'shell', 'getprop', 'ro.product.name'],
-            encoding='utf-8').strip()
-        android_version = subprocess.check_output(
-            ['adb', '-s', ip_address, 'shell', 'getprop', 'ro.build.version.release'],
-            encoding='utf-8').strip()
-        logger.info(f'Eszköz neve: {device_name}, Android verzió: {android_version}, IP cím {ip_address}.')
-        return device_name, android_version
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Hiba az eszköz információ lekérésekor: {e}', exc_info=True)
-        raise RuntimeError(f'Hiba: {e}')
+    properties = get_device_properties(ip_address)
+    device_name = properties.get('ro.product.name') or UNKNOWN_DEVICE_PROPERTY
+    android_version = properties.get('ro.build.version.release') or UNKNOWN_DEVICE_PROPERTY
+    return device_name, android_version
 
 
-def connect_device(ip_address: str) -> tuple[bool, str]:
+def invalidate_device_info(ip_address: str) -> None:
     """
-    Eszközhöz való csatlakozás ADB paranccsal.
+    Törli az eszköz gyorsítótárazott adatait, így a következő lekérés újra az eszközhöz fordul.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+    """
+    with device_info_lock:
+        device_info_cache.pop(ip_address, None)
+
+
+async def connect_device_async(ip_address: str) -> tuple[bool, str]:
+    """
+    Eszközhöz való csatlakozás ADB paranccsal, aszinkron módon.
 
     Args:
         ip_address (str): Az eszköz IP-címe.
@@ -77,13 +582,17 @@ def connect_device(ip_address: str) -> tuple[bool, str]:
             - bool: `True`, ha a csatlakozás sikeres, `False` egyébként.
             - str: A csatlakozás eredményét leíró üzenet (siker vagy hiba).
     """
-    if not is_valid_ip(ip_address):
-        logger.error(f'Csatlakozás sikertelen: Érvénytelen IP cím - {ip_address}')
-        return False, 'Érvénytelen IP cím.'
+    # A kapcsolat megszakadását a run_adb_command kezeli, így nem kell minden alkalommal újracsatlakozni
+    if ip_address in connected_ips:
+        logger.info(f'Az eszköz már csatlakoztatva van: {ip_address}')
+        return True, f'Csatlakoztatva az eszközhöz {ip_address}.'
 
-    result = run_adb_command(ip_address, ['connect', ip_address])
+    result = await run_adb_command_async(ip_address, ['connect', ip_address])
 
     if 'connected' in result.stdout.lower():
+        connected_ips.add(ip_address)
+        adb_command_prefixes[ip_address] = ('adb', '-s', ip_address)
+        invalidate_device_info(ip_address)  # Új csatlakozásnál más eszköz is lehet ezen a címen
         logger.info(f'Sikeresen csatlakozott az eszközhöz: {ip_address}')
         return True, f'Csatlakoztatva az eszközhöz {ip_address}.'
 
@@ -103,11 +612,11 @@ def disconnect_device(ip_address: str) -> tuple[bool, str]:
             - bool: `True`, ha a lecsatlakozás sikeres, `False` egyébként.
             - str: A lecsatlakozás eredményét leíró üzenet (siker vagy hiba).
     """
-    if not is_valid_ip(ip_address):
-        logger.error(f'Lecsatlakozás sikertelen: Érvénytelen IP cím - {ip_address}')
-        return False, 'Érvénytelen IP cím.'
-
+    connected_ips.discard(ip_address)  # Előbb, hogy a közben futó parancsok már ne csatlakozzanak újra
+    close_shell_session(ip_address)
     result = run_adb_command(ip_address, ['disconnect', ip_address])
+    adb_command_prefixes.pop(ip_address, None)
+    invalidate_device_info(ip_address)
 
     if 'disconnected' in result.stdout.lower():
         logger.info(f'Sikeresen lecsatlakozott az eszközről: {ip_address}')
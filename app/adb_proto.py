@@ -0,0 +1,114 @@
+import logging
+import socket
+import struct
+import subprocess
+
+# Logger inicializálása
+logger = logging.getLogger(__name__)
+
+ADB_SERVER_ADDRESS = ('127.0.0.1', 5037)  # A helyi ADB szerver címe
+ADB_SOCKET_TIMEOUT_SECONDS = 30
+
+# Shell v2 protokoll csomagtípusai
+SHELL_V2_STDOUT = 1
+SHELL_V2_STDERR = 2
+SHELL_V2_EXIT = 3
+
+
+class AdbProtocolError(RuntimeError):
+    """
+    Az ADB szerver FAIL választ adott a kérésre (pl. nem található eszköz).
+    """
+
+
+def read_exactly(sock: socket.socket, size: int) -> bytes:
+    """
+    Pontosan a megadott számú bájt beolvasása a socketről.
+
+    Args:
+        sock (socket.socket): Az ADB szerverhez kapcsolódó socket.
+        size (int): A beolvasandó bájtok száma.
+
+    Returns:
+        bytes: A beolvasott adat.
+
+    Raises:
+        ConnectionError: Ha a kapcsolat idő előtt bezárult.
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Az ADB szerver bontotta a kapcsolatot.')
+        data += chunk
+    return data
+
+
+def send_request(sock: socket.socket, request: str) -> None:
+    """
+    Egy kérés elküldése az ADB szervernek (4 jegyű hexadecimális hossz + üzenet), és a válasz ellenőrzése.
+
+    Args:
+        sock (socket.socket): Az ADB szerverhez kapcsolódó socket.
+        request (str): A kérés, pl. 'host:transport:<ip>'.
+
+    Raises:
+        AdbProtocolError: Ha a szerver FAIL választ ad.
+    """
+    payload = request.encode()
+    sock.sendall(f'{len(payload):04x}'.encode() + payload)
+
+    status = read_exactly(sock, 4)
+    if status == b'OKAY':
+        return
+    if status == b'FAIL':
+        length = int(read_exactly(sock, 4), 16)
+        raise AdbProtocolError(read_exactly(sock, length).decode(errors='replace'))
+    raise AdbProtocolError(f'Ismeretlen ADB válasz: {status!r}')
+
+
+def adb_shell(ip_address: str, command: str) -> subprocess.CompletedProcess:
+    """
+    Shell parancs futtatása közvetlenül az ADB szerveren keresztül, az adb kliens elindítása nélkül.
+
+    A shell v2 protokollt használja, így a kimenet és a hibakimenet külön érkezik, és a kilépési kód is elérhető.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+        command (str): A futtatandó shell parancs.
+
+    Returns:
+        subprocess.CompletedProcess: A parancs eredménye, ugyanolyan formában, mint a subprocess.run esetén.
+
+    Raises:
+        AdbProtocolError: Ha a szerver elutasítja a kérést.
+        OSError: Ha az ADB szerver nem érhető el.
+    """
+    stdout, stderr, returncode = [], [], None
+
+    with socket.create_connection(ADB_SERVER_ADDRESS, timeout=ADB_SOCKET_TIMEOUT_SECONDS) as sock:
+        send_request(sock, f'host:transport:{ip_address}')
+        send_request(sock, f'shell,v2,raw:{command}')
+
+        while returncode is None:
+            header = sock.recv(5)
+            if not header:  # A kapcsolat kilépési kód nélkül zárult
+                break
+            if len(header) < 5:
+                header += read_exactly(sock, 5 - len(header))
+            packet_id, length = struct.unpack('<BI', header)
+            data = read_exactly(sock, length)
+
+            if packet_id == SHELL_V2_STDOUT:
+                stdout.append(data)
+            elif packet_id == SHELL_V2_STDERR:
+                stderr.append(data)
+            elif packet_id == SHELL_V2_EXIT:
+                returncode = data[0]
+
+    return subprocess.CompletedProcess(
+        args=['adb', '-s', ip_address, 'shell', command],
+        returncode=returncode if returncode is not None else 1,
+        stdout=b''.join(stdout).decode(errors='replace'),
+        stderr=b''.join(stderr).decode(errors='replace')
+    )
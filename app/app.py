@@ -4,6 +4,7 @@ from flask import Flask
 from flask_bootstrap import Bootstrap5
 from config import SECRET_KEY, DATABASE_URI
 from database import init_app
+from adb import start_adb_server
 from routes import blueprint
 
 # Log konfiguráció
@@ -36,6 +37,9 @@ def create_app():
         with app.app_context():
             init_app(app)
 
+        # ADB szerver indítása, hogy az első kérésnek ne kelljen rá várnia
+        start_adb_server()
+
         # Bootstrap inicializálása
         Bootstrap5(app)
         logger.info('Bootstrap inicializálása sikeres volt.')
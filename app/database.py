@@ -1,12 +1,66 @@
+import datetime
+import functools
 import logging
+import threading
+import time
+from collections import deque
 
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+# A folyamatos adatgyűjtés rekordjainak kötegelt mentése, felülírható az app konfigurációban
+DEFAULT_METRIC_BATCH_SIZE = 500    # METRIC_BATCH_SIZE: ennyi rekordonként mentünk
+# METRIC_FLUSH_INTERVAL_SECONDS: legalább ilyen gyakran mentünk. Jóval a mérési gyakoriság
+# (METRIC_INTERVAL_SECONDS) felett van, különben minden mérés külön commit lenne.
+DEFAULT_METRIC_FLUSH_INTERVAL_SECONDS = 60
+RECORD_BUFFER_MAX_SIZE = 10000    # Tartós adatbázis hiba esetén a legrégebbi rekordok elvesznek
+
+# A keresőtáblák (modell, mezőértékek) -> azonosító gyorsítótára, lásd get_or_create_id
+lookup_ids: dict[tuple, int] = {}
+lookup_ids_lock = threading.Lock()
+
+# Kapcsolat pool beállítások, felülírható az app konfigurációban (SQLALCHEMY_ENGINE_OPTIONS).
+DEFAULT_ENGINE_OPTIONS = {
+    'pool_pre_ping': True,    # Megszakadt kapcsolat ne okozzon hibát a kérésben
+}
+# A pool a gunicorn szálak és az adatgyűjtők egyidejű kapcsolataihoz van méretezve. Memóriában lévő SQLite
+# adatbázisnál nem használható, ott egyetlen közös kapcsolat van (StaticPool).
+DEFAULT_POOL_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+}
+
+# A korábbi séma mérési táblái soronként tárolták az eszköz nevét és Android verzióját (device, android_version).
+# Induláskor ezeket az új sémába költöztetjük (migrate_legacy_tables): tábla -> {új oszlop: SQL kifejezés}.
+# A timestamp, ip_address és device_id oszlopokat minden táblánál a migráció tölti ki.
+# A számértékek korábban szövegként voltak tárolva (pl. '39%'), ezek a másoláskor számmá alakulnak.
+LEGACY_TABLES = {
+    'storage_usage': {'total': 'total', 'used': 'used', 'available': 'available',
+                      'percentage': "CAST(RTRIM(percentage, '%') AS REAL)"},
+    'cpu_memory_usage': {'cpu_usage': 'CAST(cpu_usage AS INTEGER)', 'cpu_core': 'CAST(cpu_core AS INTEGER)',
+                         'memory_usage': 'CAST(memory_usage AS INTEGER)',
+                         'memory_percentage': 'CAST(memory_percentage AS REAL)'},
+    'uptime_usage': {'uptime_hours': 'uptime_hours'},
+    'bad_frames_usage': {'bad_frames': 'bad_frames'},
+}
+# A szövegként tárolt számoszlopok. A régi kód hiányzó mérésnél 'None' szöveget mentett, az ilyen sorok nem
+# kerülnek át, mert a CAST csendben 0-t adna.
+LEGACY_NUMERIC_TEXT_COLUMNS = {
+    'storage_usage': ('percentage',),
+    'cpu_memory_usage': ('cpu_usage', 'cpu_core', 'memory_usage', 'memory_percentage'),
+}
+# A régi sorok időbélyege a szerver helyi ideje volt, mikroszekundumokkal ('YYYY-MM-DD HH:MM:SS.ffffff').
+# Az új sorok UTC-ben vannak, ezért az SQLite 'utc' módosítójával átszámoljuk, a tört másodperc megmarad.
+LEGACY_TIMESTAMP_TO_UTC = "datetime(legacy.timestamp, 'utc') || substr(legacy.timestamp, 20)"
+LEGACY_TABLE_SUFFIX = '_legacy'  # Az átnevezett régi táblák utótagja, amíg az adatok át nem kerülnek
+
 
 def init_app(app) -> None:
     """
@@ -18,16 +72,137 @@ def init_app(app) -> None:
     Raises:
         RuntimeError: Ha nem sikerült létrehozni az adatbázist
     """
+    if 'sqlalchemy' in app.extensions:  # Többszöri hívásnál ne regisztráljuk újra a bővítményt és az eseményeket
+        logger.warning('Az adatbázis már inicializálva van ehhez az alkalmazáshoz.')
+        return None
+
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        engine_options = dict(DEFAULT_ENGINE_OPTIONS)
+        if not is_memory_database(app.config.get('SQLALCHEMY_DATABASE_URI')):
+            engine_options.update(DEFAULT_POOL_OPTIONS)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
     try:
         db.init_app(app)
         with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', set_sqlite_pragma)
+                rename_legacy_tables()  # A create_all a régi táblákat nem alakítja át, ezért előbb félretesszük őket
             db.create_all()
+            if db.engine.dialect.name == 'sqlite':
+                migrate_legacy_tables()
         logger.info('Adatbázis inicializálása sikeres volt.')
     except Exception as e:
-        logger.error(f'Hiba az adatbázis inicializálása közben: {e}', exc_info=True)
+        logger.error('Hiba az adatbázis inicializálása közben: %s', e, exc_info=True)
         raise RuntimeError('Nem sikerült létrehozni az adatbázist.') from e
 
 
+def is_memory_database(database_uri: str | None) -> bool:
+    """
+    Megvizsgálja, hogy az adatbázis címe memóriában lévő SQLite adatbázisra mutat-e.
+
+    Args:
+        database_uri (str | None): Az adatbázis címe (SQLALCHEMY_DATABASE_URI).
+
+    Returns:
+        bool: True, ha memóriában lévő SQLite adatbázis, egyébként False.
+    """
+    if not database_uri:
+        return False
+    url = make_url(database_uri)
+    return (url.get_backend_name() == 'sqlite'
+            and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'))
+
+
+def rename_legacy_tables() -> None:
+    """
+    A korábbi sémájú (device_id helyett device és android_version oszlopos) mérési táblák átnevezése
+    LEGACY_TABLE_SUFFIX utótaggal, hogy a create_all az új sémával hozhassa létre őket. Alkalmazás kontextusban
+    kell hívni.
+
+    Az indexek nevei az egész adatbázisban egyediek, ezért a régi tábla indexei törlődnek.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in LEGACY_TABLES:
+            if not inspector.has_table(table):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table)}
+            if 'device_id' in columns or 'device' not in columns:
+                continue
+
+            for index in inspector.get_indexes(table):
+                connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+            connection.execute(text(f'ALTER TABLE "{table}" RENAME TO "{table}{LEGACY_TABLE_SUFFIX}"'))
+            logger.warning('Régi sémájú tábla átnevezve migráláshoz: %s', table)
+
+
+def migrate_legacy_tables() -> None:
+    """
+    A rename_legacy_tables által átnevezett régi táblák sorainak átmásolása az új sémájú táblákba.
+    A create_all után, alkalmazás kontextusban kell hívni.
+
+    Az eszköz neve és Android verziója a device táblába kerül, a sorok a device_id-val hivatkoznak rá.
+    A szövegként tárolt számértékek számmá alakulnak, a hiányos ('None') mérések kimaradnak. A helyi idejű
+    időbélyegek UTC-re alakulnak, hogy a régi és új sorok sorrendje és összehasonlítása helyes legyen.
+    Táblánként egy tranzakció, így hiba esetén a régi tábla megmarad, és a következő induláskor újra próbálkozunk.
+    """
+    inspector = inspect(db.engine)
+    for table, columns in LEGACY_TABLES.items():
+        legacy_table = f'{table}{LEGACY_TABLE_SUFFIX}'
+        if not inspector.has_table(legacy_table):
+            continue
+
+        target_columns = ', '.join(('timestamp', 'ip_address', 'device_id', *columns))
+        source_columns = ', '.join((LEGACY_TIMESTAMP_TO_UTC, 'legacy.ip_address', 'device.id',
+                                    *columns.values()))
+        numeric_filter = ' AND '.join(f"legacy.{column} GLOB '[0-9]*'"
+                                      for column in LEGACY_NUMERIC_TEXT_COLUMNS.get(table, ())) or '1'
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'INSERT OR IGNORE INTO device (name, android_version) '
+                f'SELECT DISTINCT device, android_version FROM "{legacy_table}"'
+            ))
+            migrated = connection.execute(text(
+                f'INSERT INTO "{table}" ({target_columns}) '
+                f'SELECT {source_columns} FROM "{legacy_table}" AS legacy '
+                f'JOIN device ON device.name = legacy.device AND device.android_version = legacy.android_version '
+                f'WHERE {numeric_filter} ORDER BY legacy.id'
+            )).rowcount
+            total = connection.execute(text(f'SELECT COUNT(*) FROM "{legacy_table}"')).scalar()
+            connection.execute(text(f'DROP TABLE "{legacy_table}"'))
+        logger.warning('Régi sémájú tábla migrálva: %s, %d sor, %d hiányos sor kihagyva', table, migrated,
+                       total - migrated)
+
+
+@functools.lru_cache(maxsize=None)
+def get_valid_fields(model: db.Model) -> frozenset[str]:
+    """
+    Visszaadja a modell oszlopainak nevét. Modellenként csak egyszer számolja ki.
+
+    Args:
+        model (db.Model): Az adatbázis modell osztálya.
+
+    Returns:
+        frozenset[str]: A modell megengedett mezőinek neve.
+    """
+    return frozenset(column.name for column in model.__table__.columns)
+
+
+def set_sqlite_pragma(dbapi_connection, connection_record) -> None:
+    """
+    SQLite kapcsolat beállítása: WAL napló és NORMAL szinkronizáció, így a commitok jóval gyorsabbak.
+
+    Args:
+        dbapi_connection: Az új SQLite kapcsolat.
+        connection_record: A kapcsolat pool bejegyzése (nem használt).
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
 def validate_record(model: db.Model, data: dict) -> dict:
     """
     Validálja a rekordot az adatbázis modelljének megfelelően.
@@ -42,16 +217,16 @@ def validate_record(model: db.Model, data: dict) -> dict:
     Raises:
         ValueError: Ha érvénytelen mezőt találunk, vagy ha egy szükséges mező hiányzik.
     """
-    valid_fields = {column.name for column in model.__table__.columns}  # Megengedett mezők
+    valid_fields = get_valid_fields(model)  # Megengedett mezők
     validated_data = {}
 
     for key, value in data.items():
         if key not in valid_fields:
-            logger.warning(f'Érvénytelen mező: {key} nem létezik a {model.__name__} modellben.')
+            logger.debug('Érvénytelen mező: %s nem létezik a %s modellben.', key, model.__name__)
             raise ValueError(f"Érvénytelen mező: {key}")
 
         if value is None:
-            logger.warning(f'Üres mező: {key} a {model.__name__} modellben.')
+            logger.debug('Üres mező: %s a %s modellben.', key, model.__name__)
             raise ValueError(f'A(z) {key} mező nem lehet üres.')
 
         validated_data[key] = value
@@ -81,12 +256,171 @@ def save_record(model: db.Model, **kwargs) -> db.Model:
         record = model(**validated_data)
         db.session.add(record)
         db.session.commit()
-        logger.info(f'Sikeresen mentett rekord: {record}')
+        logger.info('Sikeresen mentett rekord: %s', record)
         return record
     except ValueError as ve:
-        logger.error(f'Validációs hiba: {ve}')
+        logger.debug('Validációs hiba: %s', ve)  # Várható hiba, traceback nélkül
         raise
     except Exception as e:
         db.session.rollback()
-        logger.error(f'Adatbázis hiba a rekord mentése közben: {e}', exc_info=True)
+        logger.error('Adatbázis hiba a rekord mentése közben: %s', e, exc_info=True)
         raise RuntimeError('Nem sikerült menteni a rekordot az adatbázisba.') from e
+
+
+def save_records(model: db.Model, records: list[dict]) -> int:
+    """
+    Több rekord mentése az adatbázisba egyetlen tranzakcióban.
+
+    Args:
+        model (db.Model): Az adatbázis modell osztálya.
+        records (list[dict]): Az új rekordok mezőinek értékei.
+
+    Returns:
+        int: A mentett rekordok száma.
+
+    Raises:
+        ValueError: Érvénytelen adat a validáció során.
+        RuntimeError: Nem sikerült menteni a rekordokat az adatbázisba.
+    """
+    if not records:
+        return 0
+
+    try:
+        # Validáció
+        validated_records = [validate_record(model, record) for record in records]
+
+        db.session.bulk_insert_mappings(model, validated_records)
+        db.session.commit()
+        logger.info('Sikeresen mentett rekordok: %d db (%s)', len(validated_records), model.__name__)
+        return len(validated_records)
+    except ValueError as ve:
+        logger.debug('Validációs hiba: %s', ve)  # Várható hiba, traceback nélkül
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Adatbázis hiba a rekordok mentése közben: %s', e, exc_info=True)
+        raise RuntimeError('Nem sikerült menteni a rekordokat az adatbázisba.') from e
+
+
+def get_or_create_id(model: db.Model, **kwargs) -> int:
+    """
+    Visszaadja a megadott mezőértékekkel egyező rekord azonosítóját, ha nincs ilyen, létrehozza.
+
+    A keresőtáblák (pl. Device) azonosítói folyamaton belül gyorsítótárazva vannak, így ismert értékekhez
+    nem kell adatbázis lekérdezés. Alkalmazás kontextusban kell hívni.
+
+    Args:
+        model (db.Model): Az adatbázis modell osztálya (egyedi megszorítással a megadott mezőkre).
+        **kwargs: A rekord mezőinek értékei.
+
+    Returns:
+        int: A rekord azonosítója.
+
+    Raises:
+        RuntimeError: Nem sikerült lekérdezni vagy létrehozni a rekordot.
+    """
+    key = (model, tuple(sorted(kwargs.items())))
+    record_id = lookup_ids.get(key)
+    if record_id is not None:
+        return record_id
+
+    with lookup_ids_lock:
+        record_id = lookup_ids.get(key)
+        if record_id is not None:
+            return record_id
+
+        try:
+            record_id = db.session.execute(db.select(model.id).filter_by(**kwargs)).scalar()
+            if record_id is None:
+                record = model(**kwargs)
+                db.session.add(record)
+                db.session.commit()
+                record_id = record.id
+                logger.info('Új %s rekord: %s', model.__name__, kwargs)
+        except Exception as e:
+            db.session.rollback()
+            logger.error('Adatbázis hiba a(z) %s rekord lekérdezése közben: %s', model.__name__, e, exc_info=True)
+            raise RuntimeError(f'Nem sikerült lekérdezni a(z) {model.__name__} rekordot.') from e
+
+        lookup_ids[key] = record_id
+        return record_id
+
+
+class RecordBuffer:
+    """
+    A folyamatos adatgyűjtés rekordjait gyűjti, és kötegelve, egy tranzakcióban menti (save_records),
+    mérésenkénti commit helyett.
+
+    Attributes:
+        records (deque): A mentésre váró (modell, rekord) párok.
+        lock (threading.Lock): A puffert védő zár.
+        last_flush (float): Az utolsó mentés ideje (monoton óra).
+    """
+
+    def __init__(self) -> None:
+        self.records: deque[tuple[type[db.Model], dict]] = deque(maxlen=RECORD_BUFFER_MAX_SIZE)
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def add(self, model: type[db.Model], **kwargs) -> None:
+        """
+        Rekord hozzáadása a pufferhez. Ha megtelt a köteg vagy letelt az idő, menti a puffer tartalmát.
+
+        Alkalmazás kontextusban kell hívni.
+
+        Args:
+            model (db.Model): Az adatbázis modell osztálya.
+            **kwargs: Az új rekord mezőinek értékei.
+        """
+        # A mérés ideje, nem a mentésé, UTC-ben, mint az adatbázis alapértéke
+        kwargs.setdefault('timestamp', datetime.datetime.now(datetime.timezone.utc))
+        config = current_app.config
+        with self.lock:
+            self.records.append((model, kwargs))
+            flush_due = (len(self.records) >= config.get('METRIC_BATCH_SIZE', DEFAULT_METRIC_BATCH_SIZE)
+                         or time.monotonic() - self.last_flush >= config.get('METRIC_FLUSH_INTERVAL_SECONDS',
+                                                                             DEFAULT_METRIC_FLUSH_INTERVAL_SECONDS))
+        if flush_due:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        A pufferben lévő rekordok mentése modellenként egy-egy tranzakcióban. Alkalmazás kontextusban kell hívni.
+
+        Adatbázis hiba esetén a rekordok visszakerülnek a pufferbe, a következő mentéskor újra próbálkozunk.
+
+        Returns:
+            int: A mentett rekordok száma.
+        """
+        with self.lock:
+            pending = list(self.records)
+            self.records.clear()
+            self.last_flush = time.monotonic()
+
+        records_by_model: dict[type[db.Model], list[dict]] = {}
+        for model, record in pending:
+            records_by_model.setdefault(model, []).append(record)
+
+        saved = 0
+        failed: list[tuple[type[db.Model], dict]] = []
+        for model, records in records_by_model.items():
+            # Az érvénytelen rekordok egyenként esnek ki, a köteg többi része mentésre kerül
+            valid_records = []
+            for record in records:
+                try:
+                    valid_records.append(validate_record(model, record))
+                except ValueError as ve:
+                    logger.warning('Érvénytelen rekord eldobva (%s): %s', model.__name__, ve)
+            try:
+                saved += save_records(model, valid_records)
+            except RuntimeError:
+                failed.extend((model, record) for record in valid_records)
+
+        if failed:
+            # A sikertelen rekordok a közben érkezettek elé kerülnek, megteléskor a legrégebbiek esnek ki
+            with self.lock:
+                self.records = deque(failed + list(self.records), maxlen=RECORD_BUFFER_MAX_SIZE)
+        return saved
+
+
+record_buffer = RecordBuffer()
@@ -4,6 +4,15 @@ from wtforms.validators import DataRequired
 
 from validation import validate_ip
 
+# A választható tesztek, modul szinten egyszer létrehozva
+TEST_CHOICES = (
+    ('storage_usage', 'Tárhelyhasználat'),
+    ('cpu_memory_usage', 'CPU és Memória'),
+    ('uptime', 'Futási Idő'),
+    ('bad_frames', 'Hibás framek'),
+    ('all_tests', 'Összes teszt')
+)
+
 
 class IpForm(FlaskForm):
     """
@@ -17,15 +26,5 @@ class TestForm(FlaskForm):
     """
     Form a teszt kiválasztásához és elindításához.
     """
-    tests = SelectField(
-        'Válassz tesztet:',
-        choices=[
-            ('storage_usage', 'Tárhelyhasználat'),
-            ('cpu_memory_usage', 'CPU és Memória'),
-            ('uptime', 'Futási Idő'),
-            ('bad_frames', 'Hibás framek'),
-            ('all_tests', 'Összes teszt')
-        ],
-        validators=[DataRequired()]
-    )
+    tests = SelectField('Válassz tesztet:', choices=TEST_CHOICES, validators=[DataRequired()])
     submit = SubmitField('Küldés')
@@ -0,0 +1,26 @@
+import os
+
+# Gunicorn konfiguráció, indítás: gunicorn -c gunicorn_conf.py main:app
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Az adatgyűjtők és a leállításukhoz szükséges állapot a folyamaton belül él,
+# ezért egy worker fut, a párhuzamos kéréseket szálak szolgálják ki.
+# A gevent worker nem használható: a monkey patching ütközik az adatgyűjtők asyncio eseményhurkával.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# A tesztek háttérben futnak, a kérések nem várnak az ADB-re, így elég a rövidebb időkorlát
+# (a leghosszabb a tesztek leállítása, adatgyűjtőnként legfeljebb STOP_TIMEOUT_SECONDS).
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '15'))
+keepalive = 5
+
+
+def child_exit(server, worker) -> None:
+    """
+    Leállt worker metrikáinak eltávolítása, ha a Prometheus több folyamatos módban fut (PROMETHEUS_MULTIPROC_DIR).
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
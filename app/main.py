@@ -2,6 +2,8 @@ import logging
 
 from app import create_app
 
+__all__ = ['app']  # Csak az alkalmazás példány publikus (gunicorn: main:app)
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -11,6 +13,7 @@ except Exception as e:
     logger.critical(f'Kritikus hiba, nem sikerült elindítani az alkalmazást: {e}', exc_info=True)
     raise SystemExit('A program leállt, mert az alkalmazás nem tudott elindulni.')
 
+# Csak fejlesztéshez, éles futtatás: gunicorn -c gunicorn_conf.py main:app
 if __name__ == '__main__':
     try:
         logger.info('Az alkalmazás fut...')
@@ -1,36 +1,81 @@
+import asyncio
+import atexit
+import contextvars
+import functools
 import logging
+import os
 import threading
-import time
+from collections.abc import Callable, Coroutine
+from concurrent.futures import CancelledError, Future, wait
+from dataclasses import dataclass
+from typing import Any
 
-from prometheus_client import Gauge
+from prometheus_client import REGISTRY, CollectorRegistry, Gauge, multiprocess
 from flask import Flask, current_app
 
-from adb import run_adb_command
-from utils import cpu_memory_usage, get_bad_frames
+from adb import run_adb_command_async, invalidate_device_info
+from database import record_buffer
 
 
 METRIC_INTERVAL_SECONDS = 10    # Metrika lekérdezésének gyakorisága másodpercben
+STOP_TIMEOUT_SECONDS = 5    # Ennyit várunk leállításkor az adatgyűjtőre, hogy a kérés ne akadjon el
+
+NUMERIC_VALUE_UNITS = 'GMK%'  # A számok végéről levágandó mértékegységek
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
 
-# Prometheus metrikák
-cpu_user_usage = Gauge('android_cpu_user', 'User CPU usage of Android device in %')
-mem_total = Gauge('android_mem_total', 'Total memory of Android device in KB')
-mem_usage = Gauge('android_mem_used', 'Memory usage of Android device in KB')
-mem_percentage = Gauge('android_mem_usage_percent', 'Memory usage percentage of Android device')
-storage_usage = Gauge('android_storage_usage', 'Storage usage of Android device')
-storage_percentage = Gauge('android_storage_percentage', 'Storage usage percentage of Android device')
-uptime_metric = Gauge('android_uptime', 'Device uptime in seconds')
-bad_frames_metric = Gauge('android_bad_frames', 'Number of dropped frames')
-cpu_cores = Gauge('android_cpu_cores', 'Number of CPU cores in the Android device')
+# Prometheus metrikák, eszközönként külön idősorral (ip címke).
+# Több folyamatos futtatásnál az élő folyamatok értékei jelennek meg (liveall).
+DEVICE_GAUGE_OPTIONS = {'labelnames': ['ip'], 'multiprocess_mode': 'liveall'}
+cpu_user_usage = Gauge('android_cpu_user', 'User CPU usage of Android device in %', **DEVICE_GAUGE_OPTIONS)
+mem_total = Gauge('android_mem_total', 'Total memory of Android device in KB', **DEVICE_GAUGE_OPTIONS)
+mem_usage = Gauge('android_mem_used', 'Memory usage of Android device in KB', **DEVICE_GAUGE_OPTIONS)
+mem_percentage = Gauge('android_mem_usage_percent', 'Memory usage percentage of Android device', **DEVICE_GAUGE_OPTIONS)
+storage_usage = Gauge('android_storage_usage', 'Storage usage of Android device', **DEVICE_GAUGE_OPTIONS)
+storage_percentage = Gauge('android_storage_percentage', 'Storage usage percentage of Android device', **DEVICE_GAUGE_OPTIONS)
+uptime_metric = Gauge('android_uptime', 'Device uptime in seconds', **DEVICE_GAUGE_OPTIONS)
+bad_frames_metric = Gauge('android_bad_frames', 'Number of dropped frames', **DEVICE_GAUGE_OPTIONS)
+cpu_cores = Gauge('android_cpu_cores', 'Number of CPU cores in the Android device', **DEVICE_GAUGE_OPTIONS)
+
+
+def create_metrics_registry() -> CollectorRegistry:
+    """
+    Létrehozza a /metrics végpont által kiszolgált registry-t.
+
+    Ha be van állítva a PROMETHEUS_MULTIPROC_DIR, az összes gunicorn worker metrikáit a közös könyvtárból
+    gyűjti össze (MultiProcessCollector), különben az alapértelmezett, folyamaton belüli registry-t használja.
+
+    Returns:
+        CollectorRegistry: A kiszolgálandó registry.
+    """
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    logger.info('Prometheus több folyamatos mód bekapcsolva')
+    return registry
+
+
+metrics_registry = create_metrics_registry()
+
+# Az eszközönkénti (címkézett) metrikák gyorsítótára, hogy ne kelljen minden mérésnél labels()-t hívni
+gauge_children: dict[tuple[Gauge, str], Gauge] = {}
+
+# Az összes eszköz adatgyűjtése egyetlen eseményhurkon fut, nem eszközönként külön szálon
+collector_loop: asyncio.AbstractEventLoop | None = None
+collector_loop_lock = threading.Lock()
+
+# Adatgyűjtők fajtái a MonitorRegistry-ben
+CPU_MEMORY_MONITOR = 'cpu_memory'
+BAD_FRAMES_MONITOR = 'bad_frames'
 
-stop_flags_cpu_memory = {}
+cpu_cores_cache: dict[str, int] = {}    # CPU magok száma IP-címenként
 
 
 def sanitize_numeric_value(value: str) -> float:
     """
-    Eltávolítja az utolsó karaktert, ha az nem numerikus (pl. G, M, K, %) és lebegőpontos számmá alakítja.
+    Leválasztja az esetleges mértékegységet (G, M, K, %) és lebegőpontos számmá alakítja.
 
     Args:
         value (str): Az átalakítandó érték (pl. "1.2G", "500M", "75%")
@@ -38,74 +83,271 @@ def sanitize_numeric_value(value: str) -> float:
     Returns:
         float: Az átalakított numerikus érték
     """
-    if value[-1] in "GMK%":
-        value = value[:-1]  # Levágjuk az utolsó karaktert
     try:
-        return float(value)
+        return float(value.rstrip(NUMERIC_VALUE_UNITS))
     except ValueError:
         logger.error(f'Nem sikerült átalakítani numerikus értékké: {value}')
         return 0.0  # Visszaadhatunk egy alapértelmezett értéket
 
 
-def collect_cpu_memory(app: Flask, ip_address: str) -> None:
+def device_gauge(gauge: Gauge, ip_address: str) -> Gauge:
+    """
+    Visszaadja a metrika adott eszközhöz tartozó idősorát.
+
+    Args:
+        gauge (Gauge): Az ip címkével rendelkező metrika.
+        ip_address (str): Az eszköz IP-címe.
+
+    Returns:
+        Gauge: Az eszközhöz tartozó idősor, amelyre közvetlenül hívható a set().
+    """
+    key = (gauge, ip_address)
+    child = gauge_children.get(key)
+    if child is None:
+        child = gauge_children[key] = gauge.labels(ip=ip_address)
+    return child
+
+
+def get_collector_loop() -> asyncio.AbstractEventLoop:
+    """
+    Visszaadja az adatgyűjtők eseményhurkát, első híváskor elindítja egy háttérszálon.
+
+    Returns:
+        asyncio.AbstractEventLoop: Az adatgyűjtők eseményhurka.
+    """
+    global collector_loop
+    with collector_loop_lock:
+        if collector_loop is None:
+            collector_loop = asyncio.new_event_loop()
+            threading.Thread(target=collector_loop.run_forever, name='metric-collector', daemon=True).start()
+            logger.info('Adatgyűjtő eseményhurok elindítva')
+        return collector_loop
+
+
+def get_next_tick(loop: asyncio.AbstractEventLoop, previous_tick: float) -> float:
+    """
+    Kiszámolja a következő mérés időpontját a monoton óra szerint, fix METRIC_INTERVAL_SECONDS lépésközzel.
+
+    A rendszeróra állítása nem hat rá, és a lekérdezések ideje sem csúsztatja el a méréseket. Ha egy mérés
+    tovább tartott egy intervallumnál, a kimaradt méréseket nem pótolja, hanem azonnal folytatja.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): Az adatgyűjtők eseményhurka, ennek órája monoton.
+        previous_tick (float): Az előző mérés ütemezett időpontja.
+
+    Returns:
+        float: A következő mérés időpontja.
+    """
+    return max(previous_tick + METRIC_INTERVAL_SECONDS, loop.time())
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Blokkoló (ADB vagy adatbázis) hívás futtatása külön szálon, hogy ne tartsa fel az eseményhurkon futó
+    többi adatgyűjtőt.
+
+    A hívás megkapja a hívó kontextusát (mint az asyncio.to_thread), így az app kontextust is. Kilépéskor,
+    amikor már nem indítható új szál, helyben futtatja, így a leállításkori mentés ekkor is megtörténik.
+
+    Args:
+        func (Callable): A blokkoló függvény.
+        *args: A függvény pozícionális argumentumai.
+        **kwargs: A függvény kulcsszavas argumentumai.
+
+    Returns:
+        Any: A függvény visszatérési értéke.
+    """
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    try:
+        future = asyncio.get_running_loop().run_in_executor(None, call)
+    except RuntimeError:  # A szálkészlet már nem fogad új feladatot (a program leáll)
+        return call()
+    return await future
+
+
+async def wait_for_stop(stop_flag: asyncio.Event, timeout: float) -> None:
+    """
+    Legfeljebb timeout másodpercig vár a stop flag beállítására.
+
+    Args:
+        stop_flag (asyncio.Event): Az adatgyűjtés stop flagje.
+        timeout (float): A várakozás maximális ideje másodpercben.
+    """
+    try:
+        await asyncio.wait_for(stop_flag.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+@dataclass
+class Monitor:
+    """
+    Egy eszközön futó adatgyűjtő.
+
+    Attributes:
+        future (Future): Az adatgyűjtő coroutine az eseményhurkon.
+        stop_flag (asyncio.Event): Beállítása leállítja az adatgyűjtést.
+    """
+    future: Future
+    stop_flag: asyncio.Event
+
+
+class MonitorRegistry:
+    """
+    Az összes futó adatgyűjtő nyilvántartása (IP-cím, adatgyűjtő fajtája) szerint, egyetlen zárral.
+    """
+
+    def __init__(self) -> None:
+        self.monitors: dict[tuple[str, str], Monitor] = {}
+        self.lock = threading.RLock()
+
+    def start(self, ip_address: str, kind: str,
+              collector: Callable[[Flask, str, asyncio.Event], Coroutine[Any, Any, None]], app: Flask) -> bool:
+        """
+        Elindítja az adatgyűjtőt az adatgyűjtők eseményhurkán, ha még nem fut.
+
+        Args:
+            ip_address (str): Az eszköz IP-címe.
+            kind (str): Az adatgyűjtő fajtája (pl. CPU_MEMORY_MONITOR).
+            collector (Callable): Az adatgyűjtő coroutine függvény.
+            app (Flask): A Flask alkalmazás példánya.
+
+        Returns:
+            bool: True, ha elindult, False, ha már futott.
+        """
+        with self.lock:
+            monitor = self.monitors.get((ip_address, kind))
+            if monitor is not None and not monitor.future.done():
+                return False
+
+            stop_flag = asyncio.Event()
+            future = asyncio.run_coroutine_threadsafe(collector(app, ip_address, stop_flag), get_collector_loop())
+            self.monitors[(ip_address, kind)] = Monitor(future=future, stop_flag=stop_flag)
+            return True
+
+    def stop(self, ip_address: str, kind: str) -> bool:
+        """
+        Beállítja az adatgyűjtő stop flagjét és megvárja a leállását. Ha nem áll le időben, megszakítja.
+
+        Args:
+            ip_address (str): Az eszköz IP-címe.
+            kind (str): Az adatgyűjtő fajtája.
+
+        Returns:
+            bool: True, ha volt ilyen adatgyűjtő, különben False.
+        """
+        with self.lock:
+            monitor = self.monitors.pop((ip_address, kind), None)
+        if monitor is None:
+            return False
+
+        # Az asyncio.Event csak a saját hurkából állítható
+        get_collector_loop().call_soon_threadsafe(monitor.stop_flag.set)
+        if not monitor.future.done():
+            try:
+                monitor.future.result(timeout=STOP_TIMEOUT_SECONDS)  # Várunk, hogy az adatgyűjtő leálljon
+            except TimeoutError:
+                monitor.future.cancel()
+            except CancelledError:
+                pass  # Már megszakították, nincs mire várni
+            except Exception as e:  # A leállítás ettől még sikeres, a hiba ne jusson el a nézetig
+                logger.error(f'Az adatgyűjtő hibával állt le: {kind}, IP cím {ip_address}: {e}', exc_info=True)
+        return True
+
+    def stop_all(self, ip_address: str | None = None) -> int:
+        """
+        Leállítja az összes futó adatgyűjtőt, így a pufferben lévő mérések is mentésre kerülnek.
+
+        A stop flageket egyszerre állítja be, és összesen legfeljebb STOP_TIMEOUT_SECONDS-ig vár.
+        Kilépéskor automatikusan meghívódik.
+
+        Args:
+            ip_address (str | None): Ha meg van adva, csak ennek az eszköznek az adatgyűjtőit állítja le.
+
+        Returns:
+            int: A leállított adatgyűjtők száma.
+        """
+        with self.lock:
+            keys = [key for key in self.monitors if ip_address is None or key[0] == ip_address]
+            monitors = [self.monitors.pop(key) for key in keys]
+        if not monitors:
+            return 0
+
+        loop = get_collector_loop()
+        for monitor in monitors:
+            loop.call_soon_threadsafe(monitor.stop_flag.set)
+        _, pending = wait([monitor.future for monitor in monitors], timeout=STOP_TIMEOUT_SECONDS)
+        for future in pending:
+            future.cancel()
+        logger.info(f'Adatgyűjtők leállítva: {len(monitors)} db' + (f', eszköz: {ip_address}' if ip_address else ''))
+        return len(monitors)
+
+
+monitor_registry = MonitorRegistry()
+atexit.register(monitor_registry.stop_all)
+
+
+async def collect_cpu_memory(app: Flask, ip_address: str, stop_flag: asyncio.Event) -> None:
     """
     Folyamatosan gyűjti az eszköz CPU és memória használatát és elmenti adatbázisba.
 
     Args:
         app (Flask): A Flask alkalmazás példánya.
         ip_address (str): Az eszköz IP címe.
+        stop_flag (asyncio.Event): Beállítása leállítja az adatgyűjtést.
     """
 
     try:
-        result = run_adb_command(ip_address,
-                                 ['shell', 'cat', '/proc/cpuinfo', '|', 'grep', 'processor', '|', 'wc', '-l'])
-        if result.returncode != 0:
-            logger.error(f'Hiba a CPU magok számának lekérésekor: {result.stderr}')
-            return None
-
-        cpu_cores_count = int(result.stdout.strip())
-        cpu_cores.set(cpu_cores_count)  # Prometheus metrika beállítása
+        cpu_cores_count = cpu_cores_cache.get(ip_address)
+        if cpu_cores_count is None:  # A magok száma nem változik, csak az első indításkor kérdezzük le
+            result = await run_adb_command_async(ip_address, ['shell', 'nproc'])
+            if result.returncode != 0:
+                logger.error(f'Hiba a CPU magok számának lekérésekor: {result.stderr}')
+                return None
+
+            cpu_cores_count = int(result.stdout.strip())
+            cpu_cores_cache[ip_address] = cpu_cores_count
+
+        device_gauge(cpu_cores, ip_address).set(cpu_cores_count)  # Prometheus metrika beállítása
         logger.info(f'CPU magok száma sikeresen mentve: {cpu_cores_count}')
 
     except Exception as e:
         logger.error(f'Hiba a CPU magok számának lekérésekor: {e}', exc_info=True)
         return None
 
-    with app.app_context():
-        stop_flag = stop_flags_cpu_memory.get(ip_address, threading.Event())  # Meglévő vagy új Event()
-        stop_flags_cpu_memory[ip_address] = stop_flag  # Elmentjük a stop_flag-et
+    from utils import cpu_memory_usage, flush_cpu_memory_run, get_device_id  # Helyi import, a utils is importálja ezt a modult (körkörös import)
 
+    loop = asyncio.get_running_loop()
+    with app.app_context():
         try:
+            # Gyűjtés közben nem változik, egyszer kérdezzük le (ADB és adatbázis hívás, külön szálon)
+            device_id = await run_blocking(get_device_id, ip_address)
+            next_tick = loop.time()
             while not stop_flag.is_set():  # Ha a stop_flag nincs beállítva, folytatódik a ciklus
-                start_time = time.time()
-                cpu_memory_usage(ip_address, cpu_cores_count)
-                elapsed_time = time.time() - start_time
-                stop_flag.wait(max(METRIC_INTERVAL_SECONDS - elapsed_time, 0))  # Stop flag figyelése
+                await cpu_memory_usage(ip_address, cpu_cores_count, device_id)
+                next_tick = get_next_tick(loop, next_tick)
+                await wait_for_stop(stop_flag, next_tick - loop.time())  # Stop flag figyelése
         except Exception as e:
             logger.error(f'Hiba a CPU és Memória gyűjtése közben: {e}', exc_info=True)
-
-
-active_threads = {}
+        finally:
+            # Az adatbázis írás külön szálon fut, hogy ne tartsa fel a többi eszköz adatgyűjtését
+            await run_blocking(flush_cpu_memory_run, ip_address)  # A nyitott mérési sorozat lezárása
+            await run_blocking(record_buffer.flush)  # Leállításkor a pufferben maradt mérések mentése
 
 
 def start_cpu_memory_collection(ip_address: str) -> None:
     """
-    Elindítja az eszköz CPU és Memória használatának gyűjtését egy új szálon.
+    Elindítja az eszköz CPU és Memória használatának gyűjtését az adatgyűjtők eseményhurkán.
 
-    Ha már van aktív gyűjtés az adott IP-címhez, nem indít új szálat.
+    Ha már van aktív gyűjtés az adott IP-címhez, nem indít újat.
 
     Args:
         ip_address (str): Az eszköz IP-címe.
     """
-    if ip_address in active_threads and active_threads[ip_address].is_alive():
+    app = current_app._get_current_object()
+    if not monitor_registry.start(ip_address, CPU_MEMORY_MONITOR, collect_cpu_memory, app):
         logger.info(f'Az adatgyűjtés már folyamatban van ezen az eszközön: {ip_address}')
         return None
-
-    app = current_app._get_current_object()
-    stop_flags_cpu_memory[ip_address] = threading.Event()  # Új stop flag létrehozása
-    metric_thread = threading.Thread(target=collect_cpu_memory, args=(app, ip_address), daemon=True)
-    metric_thread.start()
-    active_threads[ip_address] = metric_thread
     logger.info(f'CPU és Memória adatgyűjtés elindítva: {ip_address}')
 
 
@@ -116,64 +358,54 @@ def stop_cpu_memory_collection(ip_address: str) -> None:
     Args:
         ip_address (str): Az eszköz IP-címe.
     """
-    if ip_address in active_threads:
-        stop_flag = stop_flags_cpu_memory.pop(ip_address, None)
-        if stop_flag:
-            stop_flag.set()  # Megállítjuk a szál ciklusát
-        thread = active_threads.pop(ip_address, None)
-        if thread and thread.is_alive():
-            thread.join()  # Várunk, hogy a szál leálljon
+    if monitor_registry.stop(ip_address, CPU_MEMORY_MONITOR):
+        cpu_cores_cache.pop(ip_address, None)
+        invalidate_device_info(ip_address)
         logger.info(f'CPU és Memória monitorozás leállítva: {ip_address}')
     else:
         logger.warning(f'Nincs aktív CPU és Memória monitorozás az eszközön: {ip_address}')
 
 
-stop_flags_bad_frames = {}
-
-
-def collect_bad_frames(app: Flask, ip_address: str) -> None:
+async def collect_bad_frames(app: Flask, ip_address: str, stop_flag: asyncio.Event) -> None:
     """
     Folyamatosan gyűjti az alkalmazása használata közben előforduló hibás frame-k számát és elmenti adatbázisba.
 
     Args:
         app (Flask): A Flask alkalmazás példánya.
         ip_address (str): Az eszköz IP címe.
+        stop_flag (asyncio.Event): Beállítása leállítja az adatgyűjtést.
     """
-    with app.app_context():
-        stop_flag = stop_flags_bad_frames.get(ip_address, threading.Event())
-        stop_flags_bad_frames[ip_address] = stop_flag
+    from utils import get_bad_frames, get_device_id  # Helyi import, a utils is importálja ezt a modult (körkörös import)
 
+    loop = asyncio.get_running_loop()
+    with app.app_context():
         try:
+            # Gyűjtés közben nem változik, egyszer kérdezzük le (ADB és adatbázis hívás, külön szálon)
+            device_id = await run_blocking(get_device_id, ip_address)
+            next_tick = loop.time()
             while not stop_flag.is_set():
-                start_time = time.time()
-                get_bad_frames(ip_address)
-                elapsed_time = time.time() - start_time
-                stop_flag.wait(max(METRIC_INTERVAL_SECONDS - elapsed_time, 0))
+                await get_bad_frames(ip_address, device_id=device_id)
+                next_tick = get_next_tick(loop, next_tick)
+                await wait_for_stop(stop_flag, next_tick - loop.time())
         except Exception as e:
             logger.error(f'Hiba a hibás frame-ek gyűjtése közben: {e}', exc_info=True)
-
-
-bad_frames_threads = {}
+        finally:
+            await run_blocking(record_buffer.flush)
 
 
 def start_bad_frames_collection(ip_address) -> None:
     """
-    Elindítja az eszközön a hibás frame-k gyűjtését egy új szálon.
+    Elindítja az eszközön a hibás frame-k gyűjtését az adatgyűjtők eseményhurkán.
 
-    Ha már van aktív gyűjtés az adott IP-címhez, nem indít új szálat.
+    Ha már van aktív gyűjtés az adott IP-címhez, nem indít újat.
 
     Args:
         ip_address (str): Az eszköz IP címe.
     """
-    if ip_address in bad_frames_threads and bad_frames_threads[ip_address].is_alive():
+    app = current_app._get_current_object()
+    if not monitor_registry.start(ip_address, BAD_FRAMES_MONITOR, collect_bad_frames, app):
         logger.info(f'A hibás frame-ek gyűjtése már folyamatban van: {ip_address}')
         return None
-
-    app = current_app._get_current_object()
-    stop_flags_bad_frames[ip_address] = threading.Event()
-    bad_frames_thread = threading.Thread(target=collect_bad_frames, args=(app, ip_address), daemon=True)
-    bad_frames_thread.start()
-    bad_frames_threads[ip_address] = bad_frames_thread
     logger.info(f'Hibás frame-ek adatgyűjtése elindítva: {ip_address}')
 
 
@@ -184,13 +416,20 @@ def stop_bad_frames_collection(ip_address) -> None:
     Args:
         ip_address (str): Az eszköz IP-címe.
     """
-    if ip_address in bad_frames_threads:
-        stop_flag = stop_flags_bad_frames.pop(ip_address, None)
-        if stop_flag:
-            stop_flag.set()
-        thread = bad_frames_threads.pop(ip_address, None)
-        if thread and thread.is_alive():
-            thread.join()
+    if monitor_registry.stop(ip_address, BAD_FRAMES_MONITOR):
         logger.info(f'Hibás frame-ek monitorozása leállítva: {ip_address}')
     else:
         logger.warning(f'Nincs aktív hibás frame monitorozás az eszközön: {ip_address}')
+
+
+def stop_device_collection(ip_address: str) -> None:
+    """
+    Leállítja az eszközön futó összes adatgyűjtést, pl. lecsatlakozáskor.
+
+    Args:
+        ip_address (str): Az eszköz IP-címe.
+    """
+    stopped = monitor_registry.stop_all(ip_address)
+    cpu_cores_cache.pop(ip_address, None)
+    if stopped:
+        logger.info(f'Az eszköz adatgyűjtései leállítva: {ip_address}')
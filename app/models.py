@@ -1,33 +1,52 @@
-import datetime
+from sqlalchemy import func
 
 from database import db
 
 
 # adatbázis táblák létrehozása
+# Az időbélyegek UTC-ben vannak. A korábbi, helyi idejű sorokat az induláskori migráció UTC-re alakítja
+# (database.migrate_legacy_tables).
+class Device(db.Model):
+    """
+    Az eszközök (név és Android verzió párok) táblája, a mérések erre hivatkoznak.
+
+    Attributes:
+        id (int): Egyedi azonosító.
+        name (str): Az eszköz neve.
+        android_version (str): Az eszköz Android verziója.
+    """
+    __table_args__ = (db.UniqueConstraint('name', 'android_version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    android_version = db.Column(db.String(32), nullable=False)
+
+
 class StorageUsage(db.Model):
     """
     Az eszköz tárhelyének rögzítésére szolgáló tábla.
 
     Attributes:
         id (int): Egyedi azonosító.
-        timestamp (datetime): Az adat rögzítésének ideje.
+        timestamp (datetime): Az adat rögzítésének ideje (UTC, az adatbázis állítja be).
         ip_address (str): Az eszköz IP-címe.
-        device (str): Az eszköz neve.
-        android_version (str): Az eszköz Android verziója.
-        total (str): Teljes tárhely.
+        device_id (int): Az eszköz (név és Android verzió) azonosítója a device táblában.
+        total (str): Teljes tárhely (df -h formátumban, pl. 52G).
         used (str): Tárhelyhasználat.
         available (str): Szabad tárhely.
-        percentage (str): Tárhelyhasználat százalékban.
+        percentage (float): Tárhelyhasználat százalékban.
     """
+    __table_args__ = (db.Index('ix_storage_usage_ip_address_timestamp', 'ip_address', db.desc('timestamp')),)
+
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, index=True)
-    ip_address = db.Column(db.String(100), nullable=False, index=True)
-    device = db.Column(db.String(100), nullable=False)
-    android_version = db.Column(db.String(100), nullable=False)
-    total = db.Column(db.String(100), nullable=False)
-    used = db.Column(db.String(100), nullable=False)
-    available = db.Column(db.String(100), nullable=False)
-    percentage = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    ip_address = db.Column(db.String(45), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    device = db.relationship('Device')
+    total = db.Column(db.String(16), nullable=False)
+    used = db.Column(db.String(16), nullable=False)
+    available = db.Column(db.String(16), nullable=False)
+    percentage = db.Column(db.Float, nullable=False)
 
 
 class CpuMemoryUsage(db.Model):
@@ -36,23 +55,28 @@ class CpuMemoryUsage(db.Model):
 
     Attributes:
         id (int): Egyedi azonosító.
-        timestamp (datetime): Az adat rögzítésének ideje.
+        timestamp (datetime): Az adat rögzítésének ideje (UTC, az adatbázis állítja be).
         ip_address (str): Az eszköz IP-címe.
-        device (str): Az eszköz neve.
-        android_version (str): Az eszköz Android verziója.
-        cpu_usage (str): CPU használat.
-        memory_usage (str): Memória használat.
-        memory_percentage (str): Memória használat százalékban.
+        device_id (int): Az eszköz (név és Android verzió) azonosítója a device táblában.
+        cpu_usage (int): CPU használat százalékban.
+        cpu_core (int): CPU magok száma.
+        memory_usage (int): Memória használat KB-ban.
+        memory_percentage (float): Memória használat százalékban.
+        end_timestamp (datetime): Az utolsó azonos értékű mérés ideje. Az egymást követő azonos mérések
+            egy sorba kerülnek, a sor a [timestamp, end_timestamp] időszakra érvényes.
     """
+    __table_args__ = (db.Index('ix_cpu_memory_usage_ip_address_timestamp', 'ip_address', db.desc('timestamp')),)
+
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, index=True)
-    ip_address = db.Column(db.String(100), nullable=False, index=True)
-    device = db.Column(db.String(100), nullable=False)
-    android_version = db.Column(db.String(100), nullable=False)
-    cpu_usage = db.Column(db.String(100), nullable=False)
-    cpu_core = db.Column(db.String(100), nullable=False)
-    memory_usage = db.Column(db.String(100), nullable=False)
-    memory_percentage = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    ip_address = db.Column(db.String(45), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    device = db.relationship('Device')
+    cpu_usage = db.Column(db.Integer, nullable=False)
+    cpu_core = db.Column(db.Integer, nullable=False)
+    memory_usage = db.Column(db.Integer, nullable=False)
+    memory_percentage = db.Column(db.Float, nullable=False)
+    end_timestamp = db.Column(db.DateTime(timezone=True), nullable=True)
 
 
 class UptimeUsage(db.Model):
@@ -61,17 +85,18 @@ class UptimeUsage(db.Model):
 
     Attributes:
         id (int): Egyedi azonosító.
-        timestamp (datetime): Az adat rögzítésének ideje.
+        timestamp (datetime): Az adat rögzítésének ideje (UTC, az adatbázis állítja be).
         ip_address (str): Az eszköz IP-címe.
-        device (str): Az eszköz neve.
-        android_version (str): Az eszköz Android verziója.
+        device_id (int): Az eszköz (név és Android verzió) azonosítója a device táblában.
         uptime_hours (float): Az eszköz futási idejének értéke órában.
     """
+    __table_args__ = (db.Index('ix_uptime_usage_ip_address_timestamp', 'ip_address', db.desc('timestamp')),)
+
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, index=True)
-    ip_address = db.Column(db.String(100), nullable=False, index=True)
-    device = db.Column(db.String(100), nullable=False)
-    android_version = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    ip_address = db.Column(db.String(45), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    device = db.relationship('Device')
     uptime_hours = db.Column(db.Float, nullable=False)
 
 
@@ -81,15 +106,16 @@ class BadFramesUsage(db.Model):
 
     Attributes:
         id (int): Egyedi azonosító.
-        timestamp (datetime): Az adat rögzítésének ideje.
+        timestamp (datetime): Az adat rögzítésének ideje (UTC, az adatbázis állítja be).
         ip_address (str): Az eszköz IP-címe.
-        device (str): Az eszköz neve.
-        android_version (str): Az eszköz Android verziója.
+        device_id (int): Az eszköz (név és Android verzió) azonosítója a device táblában.
         bad_frames (int): Hibás frame-ek száma.
     """
+    __table_args__ = (db.Index('ix_bad_frames_usage_ip_address_timestamp', 'ip_address', db.desc('timestamp')),)
+
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.now, index=True)
-    ip_address = db.Column(db.String(100), nullable=False, index=True)
-    device = db.Column(db.String(100), nullable=False)
-    android_version = db.Column(db.String(100), nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    ip_address = db.Column(db.String(45), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
+    device = db.relationship('Device')
     bad_frames = db.Column(db.Integer, nullable=False)
@@ -1,14 +1,15 @@
+import functools
 import logging
+from collections.abc import Callable
 
 from flask import Blueprint, render_template, redirect, url_for, session, flash
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from forms import IpForm, TestForm
-from services import run_selected_test
-from validation import is_valid_ip
-from adb import connect_device, disconnect_device
-from metrics import (start_bad_frames_collection, stop_bad_frames_collection,
-                     start_cpu_memory_collection, stop_cpu_memory_collection)
+from services import start_selected_test
+from validation import normalize_ip
+from adb import connect_device_async, disconnect_device
+from metrics import stop_bad_frames_collection, stop_cpu_memory_collection, stop_device_collection, metrics_registry
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
@@ -17,13 +18,39 @@ logger = logging.getLogger(__name__)
 blueprint = Blueprint('routes', __name__)
 
 
+def require_connected_device(view: Callable) -> Callable:
+    """
+    Dekorátor a csatlakoztatott eszközt igénylő nézetekhez.
+
+    Egyszer olvassa ki a session-ből az (a csatlakozáskor már ellenőrzött) IP-címet, és ip_address
+    kulcsszavas argumentumként adja át a nézetnek. Ha nincs csatlakoztatott eszköz, a kezdőoldalra irányít.
+
+    Args:
+        view (Callable): A nézet függvény.
+
+    Returns:
+        Callable: A becsomagolt nézet függvény.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        ip_address = session.get('ip_address')
+        if not ip_address:
+            flash('Nincs kapcsolódó eszköz.', 'hiba')
+            return redirect(url_for('routes.home'))
+        return view(*args, ip_address=ip_address, **kwargs)
+
+    return wrapper
+
+
 @blueprint.route('/', methods=['GET', 'POST'])
-def home():
+async def home():
     """
     Kezdőoldal, ahol megadható az eszköz IP-címe és csatlakozni lehet hozzá.
 
+    Aszinkron nézet, a csatlakozás az aszinkron ADB segédfüggvényen keresztül történik.
+
     GET: Megjeleníti az IP cím bekérő űrlapot.
-    POST: Validálja az IP címet és ADB-n keresztül megpróbál csatlakozni az eszközhöz.
+    POST: Validálja és normalizálja az IP címet és ADB-n keresztül megpróbál csatlakozni az eszközhöz.
 
     Returns:
         Response: A renderelt HTML sablon (index.html), vagy átirányítás a /teszt oldalra.
@@ -31,15 +58,11 @@ def home():
     form = IpForm()
 
     if form.validate_on_submit():
-        ip_address = form.ip.data.strip()
+        # Az IpForm már ellenőrizte a címet, a session-be a normalizált alak kerül, később nem ellenőrizzük újra
+        ip_address = normalize_ip(form.ip.data)
         logger.info(f'Kapott IP cím: {ip_address}')
 
-        if not is_valid_ip(ip_address):
-            flash('Érvénytelen IP cím.', 'Hiba')
-            logger.warning(f'Érvénytelen IP cím: {ip_address}')
-            return redirect(url_for('routes.home'))
-
-        success, message = connect_device(ip_address)
+        success, message = await connect_device_async(ip_address)
         if success:
             session['ip_address'] = ip_address
             flash(f'Csatlakoztatva az eszközhöz {ip_address}.', 'Siker')
@@ -52,36 +75,30 @@ def home():
 
 
 @blueprint.route('/teszt', methods=['GET', 'POST'])
-def test():
+@require_connected_device
+def test(ip_address: str):
     """
     Tesztoldal, ahol kiválasztható és elindítható egy vagy több teszt az eszközön.
 
     GET: Megjeleníti a tesztválasztó űrlapot.
-    POST: Lefuttatja a kiválasztott tesztet, és elindítja a hozzá tartozó adatgyűjtést (ha szükséges).
+    POST: A háttérben elindítja a kiválasztott tesztet és a hozzá tartozó adatgyűjtést (ha szükséges).
+
+    Args:
+        ip_address (str): A csatlakoztatott eszköz IP-címe (require_connected_device adja át).
 
     Returns:
         Response: A renderelt HTML sablon (test.html), vagy átirányítás hiba esetén.
     """
     form = TestForm()
-    ip_address = session.get('ip_address')
-
-    if not ip_address or not is_valid_ip(ip_address):
-        flash('Nincs kapcsolódó eszköz vagy hibás az IP cím.', 'hiba')
-        return redirect(url_for('routes.home'))
 
     if form.validate_on_submit():
         test_name = form.tests.data
         try:
-            run_selected_test(test_name, ip_address)
-            logger.info(f'Teszt futtatva: {test_name}, eszköz: {ip_address}')
-
-            # Ha CPU és Memória teszt, akkor indítsuk el az adatgyűjtést
-            if test_name == 'cpu_memory_usage':
-                start_cpu_memory_collection(ip_address)
-
-            if test_name == 'bad_frames':
-                start_bad_frames_collection(ip_address)
-
+            # A folyamatos adatgyűjtést is a teszt indítja
+            if start_selected_test(test_name, ip_address) is None:
+                flash('Az eszközön már fut egy teszt, az új teszt nem indult el.', 'warning')
+            else:
+                logger.info(f'Teszt elindítva: {test_name}, eszköz: {ip_address}')
         except Exception as e:
             logger.error(f'Hiba a teszt futtatása közben: {e}', exc_info=True)
             flash('Nem sikerült lefuttatni a tesztet.', 'Hiba')
@@ -97,7 +114,7 @@ def prometheus_metrics():
     Returns:
         tuple: A metrikák, HTTP státuszkód (200), és a tartalom típusa.
     """
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    return generate_latest(metrics_registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 
 # eszköz lecsatlakozása gomb
@@ -106,7 +123,7 @@ def disconnect():
     """
     Az aktuálisan csatlakoztatott eszköz lecsatlakoztatása.
 
-    Törli a session-ben tárolt IP-címet, és visszairányít a kezdőoldalra.
+    Leállítja az eszköz adatgyűjtéseit, törli a session-ben tárolt IP-címet, és visszairányít a kezdőoldalra.
 
     Returns:
         Response: Átirányítás a kezdőlapra.
@@ -114,6 +131,7 @@ def disconnect():
     ip_address = session.get('ip_address')
 
     if ip_address:
+        stop_device_collection(ip_address)  # A futó adatgyűjtők ne csatlakoztassák újra az eszközt
         success, message = disconnect_device(ip_address)
         if success:
             flash(message, 'info')
@@ -129,22 +147,18 @@ def disconnect():
 
 
 @blueprint.route('/stop_test/<test_name>', methods=['POST'])
-def stop_test(test_name):
+@require_connected_device
+def stop_test(test_name: str, ip_address: str):
     """
     Egy vagy több futó teszt (CPU/memória, hibás frame-ek) leállítása.
 
     Args:
         test_name (str): A leállítandó teszt neve ('cpu_memory_usage', 'bad_frames', 'all_tests').
+        ip_address (str): A csatlakoztatott eszköz IP-címe (require_connected_device adja át).
 
     Returns:
         Response: Átirányítás a tesztoldalra. Hiba esetén figyelmeztető üzenet.
     """
-    ip_address = session.get('ip_address')
-
-    if not ip_address or not is_valid_ip(ip_address):
-        flash('Nincs kapcsolódó eszköz vagy hibás az IP cím.', 'hiba')
-        return redirect(url_for('routes.test'))
-
     if test_name == 'cpu_memory_usage':
         stop_cpu_memory_collection(ip_address)
     elif test_name == 'bad_frames':
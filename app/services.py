@@ -1,11 +1,64 @@
 import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
 
+from flask import current_app
+
+from adb import adb_executor
 from utils import get_storage_info, get_uptime
 from metrics import start_cpu_memory_collection, start_bad_frames_collection
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
 
+# Eszközönként legfeljebb egy háttérben futó teszt (start_selected_test), így az ismételt indítások nem
+# halmozódnak fel ugyanazon az ADB munkameneten
+running_tests: dict[str, Future] = {}
+running_tests_lock = threading.Lock()
+
+
+def run_all_tests(ip_address: str) -> None:
+    """
+    Futtatja az összes tesztet egyszerre:
+        - Tárhelyhasználat
+        - CPU és Memóriainfó (folyamatosan)
+        - Rendszer futási ideje
+        - Hibás frame-k száma (folyamatosan)
+
+    Args:
+        ip_address (str): Az eszköz IP címe.
+    """
+    # A folyamatos gyűjtések csak ütemeződnek az adatgyűjtők eseményhurkán, ezért azonnal visszatérnek
+    start_cpu_memory_collection(ip_address)
+    start_bad_frames_collection(ip_address)
+
+    # Az egyszeri tesztek párhuzamosan futnak a közös szálkészletben, mindegyik saját alkalmazás kontextussal
+    app = current_app._get_current_object()
+
+    def run_in_app_context(test_function: Callable[[str], object]) -> None:
+        with app.app_context():
+            test_function(ip_address)
+
+    # Az egyik teszt ezen a szálon fut. Ha a másik még nem indult el (a szálkészlet foglalt), ezen a szálon
+    # futtatjuk le, így a szálkészletből indított hívás sem várhat a saját szálkészletére.
+    future = adb_executor.submit(run_in_app_context, get_storage_info)
+    run_in_app_context(get_uptime)
+    if future.cancel():
+        run_in_app_context(get_storage_info)
+    else:
+        future.result()  # Megvárjuk a tesztet, a hibát a hívó naplózza
+
+
+# A tesztek neve és a futtató függvényük, a teszt kiválasztásakor csak kikeressük
+TEST_FUNCTIONS: dict[str, Callable[[str], object]] = {
+    'storage_usage': get_storage_info,
+    'cpu_memory_usage': start_cpu_memory_collection,  # CPU és Memória gyűjtése folyamatosan
+    'uptime': get_uptime,
+    'bad_frames': start_bad_frames_collection,  # Hibás frame folyamatos futtatása
+    'all_tests': run_all_tests
+}
+
 
 def run_selected_test(test_name: str, ip_address: str) -> None:
     """
@@ -15,36 +68,42 @@ def run_selected_test(test_name: str, ip_address: str) -> None:
         test_name (str): A kiválasztott teszt neve.
         ip_address (str): Az eszköz IP címe.
     """
-    test_functions = {
-        'storage_usage': get_storage_info,
-        'cpu_memory_usage': start_cpu_memory_collection,  # CPU és Memória gyűjtése folyamatosan
-        'uptime': get_uptime,
-        'bad_frames': start_bad_frames_collection,  # Hibás frame folyamatos futtatása
-        'all_tests': run_all_tests
-    }
-
-    if test_name in test_functions:
-        logger.info(f'Teszt futtatása: {test_name}, eszköz: {ip_address}')
-        try:
-            test_functions[test_name](ip_address)  # Az adott teszt függvényének meghívása
-        except Exception as e:
-            logger.error(f'Hiba a teszt futtatása közben: {e}', exc_info=True)
-    else:
+    test_function = TEST_FUNCTIONS.get(test_name)
+    if test_function is None:
         logger.warning(f'Ismeretlen teszt: {test_name}')
+        return None
 
+    logger.info(f'Teszt futtatása: {test_name}, eszköz: {ip_address}')
+    try:
+        test_function(ip_address)  # Az adott teszt függvényének meghívása
+    except Exception as e:
+        logger.error(f'Hiba a teszt futtatása közben: {e}', exc_info=True)
 
-def run_all_tests(ip_address: str) -> None:
+
+def start_selected_test(test_name: str, ip_address: str) -> Future | None:
     """
-    Futtatja az összes tesztet egyszerre:
-        - Tárhelyhasználat
-        - CPU és Memóriainfó (folyamatosan)
-        - Rendszer futási ideje
-        - Hibás frame-k száma (folyamatosan)
+    Elindítja a kiválasztott tesztet a közös ADB szálkészletben, így a HTTP kérés azonnal visszatérhet.
+
+    Ha az eszközön még fut egy korábban indított teszt, az újat nem indítja el.
 
     Args:
+        test_name (str): A kiválasztott teszt neve.
         ip_address (str): Az eszköz IP címe.
+
+    Returns:
+        Future | None: A tesztet futtató feladat, vagy None, ha az eszközön már fut teszt.
     """
-    get_storage_info(ip_address)
-    start_cpu_memory_collection(ip_address)
-    get_uptime(ip_address)
-    start_bad_frames_collection(ip_address)
+    app = current_app._get_current_object()
+
+    def run_in_app_context() -> None:
+        with app.app_context():
+            run_selected_test(test_name, ip_address)
+
+    with running_tests_lock:
+        running_test = running_tests.get(ip_address)
+        if running_test is not None and not running_test.done():
+            logger.warning(f'Már fut teszt az eszközön: {ip_address}, a(z) {test_name} teszt nem indul el')
+            return None
+
+        running_tests[ip_address] = adb_executor.submit(run_in_app_context)
+        return running_tests[ip_address]
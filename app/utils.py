@@ -1,12 +1,12 @@
-import subprocess
+import datetime
+import functools
 import logging
 import re
 
-from database import save_record
-from models import CpuMemoryUsage, StorageUsage, UptimeUsage, BadFramesUsage
-from validation import is_valid_ip
-from adb import run_adb_command, get_device_info
-from metrics import sanitize_numeric_value, storage_usage, storage_percentage, uptime_metric, mem_usage, mem_total, mem_percentage, cpu_user_usage, bad_frames_metric
+from database import save_record, record_buffer, get_or_create_id
+from models import Device, CpuMemoryUsage, StorageUsage, UptimeUsage, BadFramesUsage
+from adb import run_adb_command, run_adb_command_async, get_device_info
+from metrics import run_blocking, sanitize_numeric_value, device_gauge, storage_usage, storage_percentage, uptime_metric, mem_usage, mem_total, mem_percentage, cpu_user_usage, bad_frames_metric
 
 # Logger inicializálása
 logger = logging.getLogger(__name__)
@@ -15,6 +15,35 @@ logger = logging.getLogger(__name__)
 STORAGE_PATH = '/data'  # Tárhely monitorozásának elérési útvonala
 MONITORED_PACKAGE = 'com.telekom.onetv.tv'    # Applikáció, ahol a hiábs frameket figyeli
 
+# Az egymást követő azonos CPU/memória mérések egy sorba vonódnak össze (timestamp - end_timestamp),
+# de legfeljebb ennyi ideig, hogy a mentés ne késsen sokat
+CPU_MEMORY_MAX_RUN = datetime.timedelta(minutes=5)
+CPU_MEMORY_RUN_FIELDS = ('cpu_usage', 'memory_usage', 'memory_percentage')
+cpu_memory_runs: dict[str, dict] = {}    # Eszközönként a még nyitott (nem mentett) mérési sorozat
+
+# A mérési ciklusban ismétlődő ADB parancsok, egyszer összeállítva.
+# A top kimenetéből csak a CPU és memória fejlécsor kell, a szűrés az eszközön történik (a folyamatlista nem jön át).
+# A '|| true' miatt a grep találat nélkül is sikeres, így a nem nulla kilépési kód mindig ADB hibát jelent.
+TOP_COMMAND = ('shell', 'top', '-b', '-n', '1', '|', 'grep', '-m', '2', '-E', "'%user|Mem:'", '||', 'true')
+
+CPU_USER_PATTERN = re.compile(r'(\d+)%user')  # A top CPU fejlécsora
+MEMORY_PATTERN = re.compile(r'Mem:\s+(\d+)K total,\s+(\d+)K used')  # A top memória fejlécsora
+JANKY_FRAMES_PATTERN = re.compile(r'Janky frames:[^\d\n]*(\d+)')  # A dumpsys gfxinfo hibás frame sora
+
+
+def get_device_id(ip_address: str) -> int:
+    """
+    Visszaadja az eszköz azonosítóját a device táblából, szükség esetén létrehozza. Alkalmazás kontextusban kell hívni.
+
+    Args:
+        ip_address (str): Az eszköz IP címe.
+
+    Returns:
+        int: Az eszköz (név és Android verzió pár) azonosítója.
+    """
+    device_name, android_version = get_device_info(ip_address)
+    return get_or_create_id(Device, name=device_name, android_version=android_version)
+
 
 def get_storage_info(ip_address: str, path: str = STORAGE_PATH) -> dict[str, str]:
     """
@@ -27,10 +56,6 @@ def get_storage_info(ip_address: str, path: str = STORAGE_PATH) -> dict[str, str
     Returns:
         dict: A tárhely adatait tartalmazó szótár.
     """
-    if not is_valid_ip(ip_address):
-        logger.error(f'Érvénytelen IP cím: {ip_address}')
-        return {}
-
     try:
         result = run_adb_command(ip_address, ['shell', 'df', '-h', path])
 
@@ -38,35 +63,29 @@ def get_storage_info(ip_address: str, path: str = STORAGE_PATH) -> dict[str, str
             logger.error(f'Hiba a tárhely adatok lekérésekor: {result.stderr}')
             return {}
 
-        lines = result.stdout.splitlines()
-        if len(lines) < 2:
+        # A fejléc utáni első sor: fájlrendszer, teljes, foglalt, szabad tárhely, használati arány
+        data_line = result.stdout.partition('\n')[2].split()
+        if len(data_line) < 5:
             logger.error('Nem sikerült feldolgozni a tárhely adatokat.')
             return {}
+        _, total, used, available, percentage = data_line[:5]
 
-        data_line = lines[1].split()
-        storage_info = {
-            'total': data_line[1],  # Teljes tárhely
-            'usage': data_line[2],  # Foglalt tárhely
-            'available': data_line[3],  # Szabad tárhely
-            'percentage': data_line[4]  # Használati arány
-        }
-
-        storage_usage.set(sanitize_numeric_value(storage_info['usage']))
-        storage_percentage.set(sanitize_numeric_value(storage_info['percentage']))
+        usage_percentage = sanitize_numeric_value(percentage)
+        device_gauge(storage_usage, ip_address).set(sanitize_numeric_value(used))
+        device_gauge(storage_percentage, ip_address).set(usage_percentage)
 
         try:
-            device_name, android_version = get_device_info(ip_address)
             save_record(
                 StorageUsage,
                 ip_address=ip_address,
-                device=device_name,
-                android_version=android_version,
-                total=storage_info['total'],
-                used=storage_info['usage'],
-                available=storage_info['available'],
-                percentage=storage_info['percentage']
+                device_id=get_device_id(ip_address),
+                total=total,
+                used=used,
+                available=available,
+                percentage=usage_percentage
             )
-            logger.info(f'Tárhely adatok sikeresen mentve: {storage_info}')
+            logger.info(f'Tárhely adatok sikeresen mentve: teljes {total}, foglalt {used}, szabad {available}, '
+                        f'használat {percentage}')
         except Exception as e:
             logger.error(f'Hiba a tárhely adatok mentése közben: {e}', exc_info=True)
     except Exception as e:
@@ -84,10 +103,6 @@ def get_uptime(ip_address: str) -> float | None:
     Returns:
         float | None: Az eszköz futási ideje órában, vagy None, ha hiba történt.
     """
-    if not is_valid_ip(ip_address):
-        logger.warning(f'Érvénytelen IP cím: {ip_address}')
-        return None
-
     try:
         result = run_adb_command(ip_address, ['shell', 'cat', '/proc/uptime'])
         if result.returncode != 0:
@@ -96,17 +111,13 @@ def get_uptime(ip_address: str) -> float | None:
 
         uptime_seconds = float(result.stdout.split()[0])
         uptime_hours = uptime_seconds / 3600
-        uptime_metric.set(uptime_hours)
-
-        # Eszköz adatok lekérése
-        device_name, android_version = get_device_info(ip_address)
+        device_gauge(uptime_metric, ip_address).set(uptime_hours)
 
         # Uptime mentése adatbázisba
         save_record(
             UptimeUsage,
             ip_address=ip_address,
-            device=device_name,
-            android_version=android_version,
+            device_id=get_device_id(ip_address),
             uptime_hours=uptime_hours
         )
         logger.info(f'Uptime adatok sikeresen mentve: {uptime_hours} óra')
@@ -117,108 +128,158 @@ def get_uptime(ip_address: str) -> float | None:
         return None
 
 
-def cpu_memory_usage(ip_address: str, cpu_core: int) -> None:
+def record_cpu_memory_sample(record: dict) -> None:
     """
-    ADB paranccsal lekéri az eszköz CPU és memóriahasználati adatait és elmenti adatbázisba.
+    CPU és memória mérés rögzítése futáshossz-kódolással.
+
+    Ha a mért értékek megegyeznek az eszköz előző mérésével, csak a nyitott sorozat end_timestamp-jét
+    frissíti, különben az előző sorozatot a pufferbe teszi (RecordBuffer) és újat nyit.
+
+    Args:
+        record (dict): A CpuMemoryUsage rekord mezői (timestamp nélkül).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ip_address = record['ip_address']
+    run = cpu_memory_runs.get(ip_address)
+
+    if (run is not None and all(run[field] == record[field] for field in CPU_MEMORY_RUN_FIELDS)
+            and now - run['timestamp'] < CPU_MEMORY_MAX_RUN):
+        run['end_timestamp'] = now
+        return None
+
+    flush_cpu_memory_run(ip_address)
+    cpu_memory_runs[ip_address] = {**record, 'timestamp': now, 'end_timestamp': now}
+
+
+def flush_cpu_memory_run(ip_address: str) -> None:
+    """
+    Az eszköz nyitott CPU és memória mérési sorozatának átadása mentésre. Alkalmazás kontextusban kell hívni.
+
+    Args:
+        ip_address (str): Az eszköz IP címe.
+    """
+    run = cpu_memory_runs.pop(ip_address, None)
+    if run is not None:
+        record_buffer.add(CpuMemoryUsage, **run)
+
+
+async def cpu_memory_usage(ip_address: str, cpu_core: int, device_id: int | None = None) -> None:
+    """
+    ADB paranccsal aszinkron módon lekéri az eszköz CPU és memóriahasználati adatait és elmenti adatbázisba.
 
     Args:
         ip_address (str): Az eszköz IP címe.
         cpu_core (int): Processzor magok száma.
+        device_id (int | None): Az eszköz azonosítója (get_device_id), ha nincs megadva, lekérdezi.
 
     Returns:
         None
     """
     try:
-        output = subprocess.check_output(['adb', '-s', ip_address, 'shell', 'top', '-b', '-n', '1'], text=True)
-        lines = output.split('\n')
+        result = await run_adb_command_async(ip_address, TOP_COMMAND)
+        if result.returncode != 0:
+            logger.error(f'Hiba az ADB parancs futtatása közben: {result.stderr}')
+            return None
 
+        # Egy-egy keresés a teljes kimeneten, soronkénti feldolgozás nélkül
         cpu_used = None
         memory_total = None
         memory_used = None
 
-        for line in lines:
-            # CPU used keresése
-            cpu_match = re.search(r'(\d+)%user', line)
-            if cpu_match:
-                cpu_used = int(cpu_match.group(1))
+        # CPU used keresése
+        cpu_match = CPU_USER_PATTERN.search(result.stdout)
+        if cpu_match:
+            cpu_used = int(cpu_match.group(1))
 
-            # Memóriahasználat keresése
-            mem_match = re.search(r'Mem:\s+(\d+)K total,\s+(\d+)K used', line)
-            if mem_match:
-                memory_total = int(mem_match.group(1))
-                memory_used = int(mem_match.group(2))
+        # Memóriahasználat keresése
+        mem_match = MEMORY_PATTERN.search(result.stdout)
+        if mem_match:
+            memory_total = int(mem_match.group(1))
+            memory_used = int(mem_match.group(2))
 
         # Ha megtaláltuk az adatokat, frissítjük a Prometheus metrikákat
         if cpu_used is not None:
-            cpu_user_usage.set(cpu_used)
+            device_gauge(cpu_user_usage, ip_address).set(cpu_used)
             logger.info(f'CPU használat: {cpu_used}%')
 
         if memory_total is not None and memory_used is not None:
-            mem_total.set(memory_total)
-            mem_usage.set(memory_used)
-            mem_percentage.set((memory_used / memory_total) * 100)
+            device_gauge(mem_total, ip_address).set(memory_total)
+            device_gauge(mem_usage, ip_address).set(memory_used)
+            device_gauge(mem_percentage, ip_address).set((memory_used / memory_total) * 100)
             logger.info(f'Összes memória: {memory_total} KB, Használt memória: {memory_used} KB, '
                         f'használt memória (százalékban): {round((memory_used / memory_total) * 100, 2)}%')
 
-        # Adatok mentése adatbázisba
-        if cpu_used is not None or (memory_total is not None and memory_used is not None):
-            device_name, android_version = get_device_info(ip_address)
-            save_record(
-                CpuMemoryUsage,
-                ip_address=ip_address,
-                device=device_name,
-                android_version=android_version,
-                cpu_usage=str(cpu_used),
-                cpu_core=str(cpu_core),
-                memory_usage=str(memory_used),
-                memory_percentage=str((memory_used / memory_total) * 100)
-            )
-            logger.info(f'CPU és Memória adatok sikeresen mentve: '
+        # Adatok mentése adatbázisba, az oszlopok számok és kötelezőek, ezért csak teljes mérést mentünk.
+        # Az ADB és adatbázis hívások külön szálon futnak, hogy ne tartsák fel a többi eszköz adatgyűjtését
+        if cpu_used is not None and memory_total is not None and memory_used is not None:
+            if device_id is None:
+                device_id = await run_blocking(get_device_id, ip_address)
+            await run_blocking(record_cpu_memory_sample, {
+                'ip_address': ip_address,
+                'device_id': device_id,
+                'cpu_usage': cpu_used,
+                'cpu_core': cpu_core,
+                'memory_usage': memory_used,
+                'memory_percentage': (memory_used / memory_total) * 100
+            })
+            logger.info(f'CPU és Memória adatok rögzítve: '
                         f'{cpu_used}, {memory_used}, {(memory_used / memory_total) * 100}%')
 
-    except subprocess.CalledProcessError as e:
+    except OSError as e:
         logger.error(f'Hiba az ADB parancs futtatása közben: {e}')
 
 
-def get_bad_frames(ip_address: str, package_name: str = MONITORED_PACKAGE) -> int | None:
+@functools.lru_cache(maxsize=None)
+def get_bad_frames_command(package_name: str) -> tuple[str, ...]:
+    """
+    Összeállítja a hibás frame-ek lekérdezésének ADB parancsát. Csomagonként csak egyszer.
+
+    A szűrés az eszközön történik, így a teljes gfxinfo kimenet helyett csak egy sor jön át. Ha a grep nem talál
+    semmit, a parancs akkor is sikeres, így a nem nulla kilépési kód mindig ADB hibát jelent.
+
+    Args:
+        package_name (str): A figyelt alkalmazás csomagneve.
+
+    Returns:
+        tuple[str, ...]: Az ADB parancs és argumentumai.
+    """
+    return 'shell', 'dumpsys', 'gfxinfo', package_name, '|', 'grep', '-m', '1', "'Janky frames'", '||', 'true'
+
+
+async def get_bad_frames(ip_address: str, package_name: str = MONITORED_PACKAGE,
+                         device_id: int | None = None) -> int | None:
     """
-    Lekéri az adott alkalmazás hibás framejeinek számát ADB paranccsal és elmenti adatbázisba.
+    Aszinkron módon lekéri az adott alkalmazás hibás framejeinek számát ADB paranccsal és elmenti adatbázisba.
 
     Args:
         ip_address (str): Az eszköz IP címe.
         package_name (str): A figyelt alkalmazás csomagneve
+        device_id (int | None): Az eszköz azonosítója (get_device_id), ha nincs megadva, lekérdezi.
 
     Returns:
         int | None: Hibás frame-ek száma, vagy None, ha hiba történt.
     """
     try:
-        result = run_adb_command(ip_address, ['shell', 'dumpsys', 'gfxinfo', package_name])
+        result = await run_adb_command_async(ip_address, get_bad_frames_command(package_name))
         if result.returncode != 0:
             logger.error(f'Hiba a frame adatok lekérésekor: {result.stderr}')
             return None
 
-        dropped_frames = 0
-        for line in result.stdout.splitlines():
-            if 'Janky frames' in line:
-                frame_value = line.split(':')[1].strip()
-                frame_number = re.findall(r'\d+', frame_value)  # Csak számokat keresünk
-                if frame_number:
-                    dropped_frames = int(frame_number[0])  # Az első számot használjuk
-                break
-
-        bad_frames_metric.set(dropped_frames)
-        # Eszköz adatok lekérése
-        device_name, android_version = get_device_info(ip_address)
+        frames_match = JANKY_FRAMES_PATTERN.search(result.stdout)
+        dropped_frames = int(frames_match.group(1)) if frames_match else 0
 
-        # Hibás framek mentése adatbázisba
-        save_record(
+        device_gauge(bad_frames_metric, ip_address).set(dropped_frames)
+        # Hibás framek mentése adatbázisba (kötegelve), külön szálon, mint a CPU és memória méréseknél
+        if device_id is None:
+            device_id = await run_blocking(get_device_id, ip_address)
+        await run_blocking(
+            record_buffer.add,
             BadFramesUsage,
             ip_address=ip_address,
-            device=device_name,
-            android_version=android_version,
+            device_id=device_id,
             bad_frames=dropped_frames
         )
-        logger.info(f'Hibás frame adatok sikeresen mentve: {dropped_frames}')
+        logger.info(f'Hibás frame adatok rögzítve: {dropped_frames}')
 
         return dropped_frames
     except Exception as e: